@@ -0,0 +1,191 @@
+"""Benchmark Murty's algorithm with and without warm starts."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import argparse
+import json
+import time
+import numpy as np
+from scipy.sparse import random as sparse_random
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+import mht
+import murty
+from mht import cluster as mht_cluster, hypgen
+from benchmarks.scenario import Scenario
+
+
+def tracker_problems(targets, clutter, scans, k_max, seed):
+    """Run a scenario in one cluster, and return its assignment problems.
+
+    The problems are the (C, unassigned) arguments of the k-best
+    assignments for every parent hypothesis and scan. The scan number and
+    column keys of each problem are returned in a second list.
+    """
+    problems = []
+    columns = []
+    kbest = mht_cluster.kbest_assignments
+
+    def record(C, unassigned, session=None, keys=None):
+        problems.append((C.copy(), np.array(unassigned, dtype=float)))
+        columns.append((scan_no, list(keys)))
+        return kbest(C, unassigned, session, keys)
+
+    def initer(c):
+        c.params = mht.ClusterParameters(k_max=k_max, hp_limit=5)
+
+    scenario = Scenario(targets=targets, clutter=clutter, scans=scans,
+                        seed=seed)
+    mht_cluster.kbest_assignments = record
+    try:
+        c = mht.cluster.Cluster.initial(initer, scenario.initial_filters())
+        last = None
+        for scan_no, (t, scan) in enumerate(scenario.scans()):
+            if last is not None:
+                c.predict(t - last)
+            last = t
+            c.register_scan(scan)
+    finally:
+        mht_cluster.kbest_assignments = kbest
+    return problems, columns
+
+
+def random_problems(n, rows, cols, density, seed):
+    """Return n random problems, dense if density is 1."""
+    rng = np.random.RandomState(seed)
+    problems = []
+    for _ in range(n):
+        if density < 1:
+            C = sparse_random(rows, cols, density, format='csr',
+                              random_state=rng) * 10
+        else:
+            C = rng.uniform(0, 10, (rows, cols))
+        problems.append((C, np.full(rows, 5.0)))
+    return problems
+
+
+def draw(problems, k, msc):
+    """Draw k solutions from each problem, returning the costs."""
+    costs = []
+    for C, unassigned in problems:
+        m = murty.Murty(C, unassigned)
+        m.msc = msc
+        costs.append(m.draw_k(k)[0])
+    return costs
+
+
+def bench(problems, k, repeat):
+    """Time drawing from problems with and without re-solving."""
+    results = {}
+    for msc in (False, True):
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            costs = draw(problems, k, msc)
+            best = min(best, time.perf_counter() - t0)
+        results['msc' if msc else 'scratch'] = {'time_s': best,
+                                                'costs': costs}
+    for a, b in zip(results['scratch']['costs'], results['msc']['costs']):
+        assert np.allclose(a, b), "Solvers disagree"
+    for r in results.values():
+        del r['costs']
+    return results
+
+
+def bench_seeded(problems, columns, repeat):
+    """Time the first solutions of each scan's problems, seeded in turn."""
+    def first(seeded):
+        costs = []
+        session = None
+        for (C, unassigned), (scan_no, keys) in zip(problems, columns):
+            if session is None or scan_no != session.scan_no:
+                session = hypgen.MurtySession()
+                session.scan_no = scan_no
+            if seeded:
+                draws = session.murty(C, unassigned, keys)
+            else:
+                draws = hypgen.murty(C, unassigned)
+            costs.append(next(draws)[0])
+        return costs
+
+    results = {}
+    for seeded in (False, True):
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            costs = first(seeded)
+            best = min(best, time.perf_counter() - t0)
+        results['seeded' if seeded else 'unseeded'] = {'time_s': best,
+                                                      'costs': costs}
+    assert np.allclose(results['seeded']['costs'],
+                       results['unseeded']['costs']), "Solvers disagree"
+    for r in results.values():
+        del r['costs']
+    return results
+
+
+def parse_args(*argv):
+    """Parse args."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--targets', type=int, default=10)
+    parser.add_argument('--clutter', type=float, default=1e-3)
+    parser.add_argument('--scans', type=int, default=10)
+    parser.add_argument('--k-max', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(*argv):
+    """Main."""
+    args = parse_args(*argv)
+    tracker, columns = tracker_problems(args.targets, args.clutter,
+                                        args.scans, args.k_max, args.seed)
+    sets = {
+        'tracker': tracker,
+        'dense 20x20': random_problems(20, 20, 20, 1, args.seed),
+        'dense 100x100': random_problems(5, 100, 100, 1, args.seed),
+        'sparse 200x400': random_problems(5, 200, 400, 0.02, args.seed),
+    }
+    results = {}
+    for name, problems in sets.items():
+        results[name] = bench(problems, args.k_max, args.repeat)
+        results[name]['problems'] = len(problems)
+        results[name]['mean_size'] = float(np.mean(
+            [C.shape[0] * C.shape[1] for C, _ in problems]))
+    first = bench_seeded(tracker, columns, args.repeat)
+    if args.json:
+        print(json.dumps({'kbest': results, 'first': first}, indent=2))
+        return
+    print("{:<16} {:>8} {:>10} {:>10} {:>10} {:>8}".format(
+        'problems', 'count', 'size', 'scratch s', 'msc s', 'speedup'))
+    for name, r in results.items():
+        print("{:<16} {:>8} {:>10.0f} {:>10.4f} {:>10.4f} {:>7.2f}x".format(
+            name, r['problems'], r['mean_size'], r['scratch']['time_s'],
+            r['msc']['time_s'],
+            r['scratch']['time_s'] / r['msc']['time_s']))
+    print("First tracker solutions: {:.4f} s unseeded, {:.4f} s seeded "
+          "across parents".format(first['unseeded']['time_s'],
+                                  first['seeded']['time_s']))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
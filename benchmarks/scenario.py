@@ -0,0 +1,131 @@
+"""Seeded synthetic tracking scenarios."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+from math import log
+import numpy as np
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+import mht
+from mht.utils import within
+
+
+class Scenario:
+    """Seeded scenario of constant velocity targets observed in clutter.
+
+    Targets start on the border of a square area of side size and move with
+    the given speed. A fraction crossing of them is aimed at the centre of
+    the area, so that they cross each other half way through the scenario;
+    the rest move along parallel lanes. Each target is detected with
+    probability pd, and clutter is uniform with density clutter reports per
+    unit area. The sensor is either "eye" (EyeOfMordor, sees the whole
+    plane) or "satellite" (Satellite, field of view covering the central
+    half of the area).
+    """
+
+    def __init__(self, targets=10, clutter=1e-3, pd=0.9, crossing=0.2,
+                 sensor="eye", scans=20, size=100.0, speed=None,
+                 noise=0.1, seed=1):
+        """Init."""
+        if sensor not in ("eye", "satellite"):
+            raise ValueError("Unknown sensor: {}".format(sensor))
+        self.ntargets = targets
+        self.clutter = clutter
+        self.pd = pd
+        self.crossing = crossing
+        self.sensor_type = sensor
+        self.nscans = scans
+        self.size = size
+        self.speed = speed if speed is not None else size / scans
+        self.noise = noise
+        self.seed = seed
+        self.rng = np.random.RandomState(seed)
+        self.states = self._initial_states()
+
+    def _initial_states(self):
+        """Draw initial target states."""
+        n = self.ntargets
+        ncross = int(round(self.crossing * n))
+        states = []
+        centre = np.array([self.size / 2, self.size / 2])
+        for i in range(n):
+            if i < ncross:
+                heading = self.rng.uniform(0, 2 * np.pi)
+                v = self.speed * np.array([np.cos(heading), np.sin(heading)])
+                p = centre - v * self.nscans / 2
+            else:
+                lane = (i - ncross + 0.5) / max(n - ncross, 1)
+                p = np.array([0.0, lane * self.size])
+                v = np.array([self.speed, 0.0])
+            states.append(np.concatenate([p, v]))
+        return states
+
+    def fov(self):
+        """Return the sensor field of view."""
+        if self.sensor_type == "eye":
+            return (0.0, self.size, 0.0, self.size)
+        q = self.size / 4
+        return (q, self.size - q, q, self.size - q)
+
+    def sensor(self):
+        """Create the sensor."""
+        score_miss = -log(1 - self.pd) if self.pd < 1 else 0
+        score_extraneous = -log(self.clutter) if self.clutter > 0 else 10
+        if self.sensor_type == "eye":
+            return mht.sensors.EyeOfMordor(score_extraneous, score_miss)
+        return mht.sensors.Satellite(self.fov(), score_extraneous,
+                                     score_miss)
+
+    def initial_filters(self):
+        """Return filters for the initial targets."""
+        return [mht.kf.KFilter(
+            mht.models.ConstantVelocityModel(0.1),
+            x + self.rng.normal(0, self.noise, 4),
+            np.eye(4)) for x in self.states]
+
+    def _scan(self, sensor):
+        """Draw reports for the current target states."""
+        R = np.eye(2) * self.noise ** 2
+        reports = []
+        for i, x in enumerate(self.states):
+            if sensor.in_fov(x[0:2]) and self.rng.uniform() < self.pd:
+                reports.append(mht.Report(
+                    self.rng.multivariate_normal(x[0:2], R), R,
+                    mht.models.position_measurement, i))
+        fov = self.fov()
+        area = (fov[1] - fov[0]) * (fov[3] - fov[2])
+        for _ in range(self.rng.poisson(self.clutter * area)):
+            z = np.array([self.rng.uniform(fov[0], fov[1]),
+                          self.rng.uniform(fov[2], fov[3])])
+            reports.append(mht.Report(z, R, mht.models.position_measurement))
+        return mht.Scan(sensor, reports)
+
+    def scans(self, dT=1.0):
+        """Generate (time, scan) tuples, moving the targets between scans."""
+        sensor = self.sensor()
+        for k in range(self.nscans):
+            if k > 0:
+                for x in self.states:
+                    x[0:2] += x[2:] * dT
+            yield k * dT, self._scan(sensor)
+
+    def targets_in_fov(self):
+        """Return number of targets currently in the field of view."""
+        return sum(within(x[0:2], self.fov()) for x in self.states)
@@ -0,0 +1,124 @@
+"""Benchmark cluster serialization against pickle."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import argparse
+import json
+import pickle
+import time
+import numpy as np
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+import mht
+from mht import serialize
+
+
+def make_clusters(ntargets, nscans, seed):
+    """Run a crossing-targets scenario and return the resulting clusters."""
+    np.random.seed(seed)
+    tracker = mht.MHT(cparams=mht.ClusterParameters(k_max=50, hp_limit=5))
+    targets = [np.array([0.0, 2.0 * i, 1.0, (-1) ** i * 0.1])
+               for i in range(ntargets)]
+    sensor = mht.sensors.EyeOfMordor(3, 3)
+    for k in range(nscans):
+        if k > 0:
+            tracker.predict(1)
+            for t in targets:
+                t[0:2] += t[2:]
+        tracker.register_scan(mht.Scan(sensor, [
+            mht.Report(np.random.multivariate_normal(t[0:2],
+                                                     np.diag([0.1, 0.1])),
+                       np.eye(2) * 0.1, mht.models.position_measurement, i)
+            for i, t in enumerate(targets)]))
+    tracker._load_clusters()
+    clusters = list(tracker.active_clusters)
+    tracker.close()
+    return clusters
+
+
+def timeit(fn, repeat):
+    """Return best wall time of fn over repeat runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench(clusters, repeat):
+    """Measure throughput and size for each codec."""
+    codecs = {
+        'pickle': (lambda c: pickle.dumps(c, pickle.HIGHEST_PROTOCOL),
+                   pickle.loads),
+    }
+    for compression in serialize.CODECS:
+        codecs['mhtc-{}'.format(compression or 'raw')] = (
+            lambda c, z=compression: serialize.dumps(c, z),
+            serialize.loads)
+
+    results = {}
+    for name, (enc, dec) in codecs.items():
+        blobs = [enc(c) for c in clusters]
+        size = sum(len(b) for b in blobs)
+        tenc = timeit(lambda: [enc(c) for c in clusters], repeat)
+        tdec = timeit(lambda: [dec(b) for b in blobs], repeat)
+        results[name] = {
+            'bytes': size,
+            'encode_s': tenc,
+            'decode_s': tdec,
+            'encode_clusters_per_s': len(clusters) / tenc,
+            'decode_clusters_per_s': len(clusters) / tdec,
+        }
+    return results
+
+
+def parse_args(*argv):
+    """Parse args."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--targets', type=int, default=20)
+    parser.add_argument('--scans', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(*argv):
+    """Main."""
+    args = parse_args(*argv)
+    clusters = make_clusters(args.targets, args.scans, args.seed)
+    results = bench(clusters, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print("{} clusters, {} tracks".format(
+        len(clusters),
+        sum(len(t.tracks) for c in clusters for t in c.targets)))
+    print("{:<12} {:>10} {:>12} {:>12}".format(
+        'codec', 'bytes', 'enc c/s', 'dec c/s'))
+    for name, r in results.items():
+        print("{:<12} {:>10} {:>12.0f} {:>12.0f}".format(
+            name, r['bytes'], r['encode_clusters_per_s'],
+            r['decode_clusters_per_s']))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,66 @@
+"""Calibrate the assignment solver thresholds on this host."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import argparse
+import json
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+from mht import solvers
+import mht.hypgen  # noqa: F401, registers the murty solver
+
+
+def parse_args(*argv):
+    """Parse args."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[2, 4, 8, 16, 32, 64])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-murty', action="store_true",
+                        help="Calibrate as if the extension was not built.")
+    parser.add_argument('--json', action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(*argv):
+    """Main."""
+    args = parse_args(*argv)
+    if args.no_murty:
+        solvers._extension = False
+    timings = solvers.calibrate(args.sizes, args.k, args.repeat, args.seed)
+    if args.json:
+        print(json.dumps({'timings': timings,
+                          'thresholds': solvers.THRESHOLDS}, indent=2))
+        return
+    names = solvers.available()
+    for kind, sizes in timings.items():
+        print(kind)
+        print(("{:>8}" + " {:>10}" * len(names)).format('size', *names))
+        for size, times in sizes.items():
+            print(("{:>8}" + " {:>10}" * len(names)).format(
+                size, *("{:.3f} ms".format(times[name] * 1e3)
+                        if name in times else '-' for name in names)))
+    print("THRESHOLDS = {!r}".format(solvers.THRESHOLDS))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,276 @@
+"""Benchmark end-to-end tracking on synthetic scenarios."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import time
+from collections import Counter
+import numpy as np
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+import mht
+from benchmarks.scenario import Scenario
+
+DEFAULTS = {
+    'targets': 10,
+    'clutter': 1e-3,
+    'pd': 0.9,
+    'crossing': 0.2,
+    'sensor': "eye",
+    'scans': 20,
+    'seed': 1,
+}
+
+SWEEPS = {
+    'targets': [5, 10, 20, 40, 80],
+    'clutter': [0, 1e-3, 3e-3, 1e-2],
+    'pd': [0.7, 0.8, 0.9, 0.99],
+    'crossing': [0, 0.2, 0.5, 1],
+    'sensor': ["eye", "satellite"],
+}
+
+STAGES = ('predict', 'register_scan', 'best_hypothesis')
+
+
+def percentiles(values):
+    """Summarise a list of latencies."""
+    if not values:
+        return {}
+    values = np.asarray(values)
+    return {
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max()),
+    }
+
+
+def peak_rss():
+    """Return peak resident set size in bytes, of self and of children."""
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'children':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def run_point(params, tracker_args):
+    """Run one scenario end to end and return its metrics."""
+    scenario = Scenario(**params)
+    stats = mht.Stats()
+    tracker = mht.MHT(
+        cparams=mht.ClusterParameters(k_max=tracker_args['k_max'],
+                                      hp_limit=tracker_args['hp_limit'],
+                                      n_scan=tracker_args.get('n_scan')),
+        matching_algorithm=tracker_args['matching'],
+        worker_mode=tracker_args['worker_mode'],
+        nworkers=tracker_args['workers'],
+        stats=stats)
+    latency = {stage: [] for stage in STAGES}
+    hyps_per_cluster = []
+    cluster_sizes = []
+    nreports = 0
+    try:
+        tracker.initiate_clusters(scenario.initial_filters())
+        last = None
+        t0 = time.perf_counter()
+        for t, scan in scenario.scans():
+            nreports += len(scan.reports)
+            if last is not None:
+                ts = time.perf_counter()
+                tracker.predict(t - last)
+                latency['predict'].append(time.perf_counter() - ts)
+            last = t
+            ts = time.perf_counter()
+            tracker.register_scan(scan)
+            latency['register_scan'].append(time.perf_counter() - ts)
+            ts = time.perf_counter()
+            best = tracker.best_global_hypothesis()
+            latency['best_hypothesis'].append(time.perf_counter() - ts)
+            for c in tracker.active_clusters:
+                hyps_per_cluster.append(len(c.hypotheses))
+                cluster_sizes.append(len(c.targets))
+        elapsed = time.perf_counter() - t0
+    finally:
+        tracker.close()
+
+    return {
+        'scans_per_s': scenario.nscans / elapsed,
+        'reports_per_s': nreports / elapsed,
+        'elapsed_s': elapsed,
+        'latency_s': {stage: percentiles(v) for stage, v in latency.items()},
+        'peak_rss_bytes': peak_rss(),
+        'hyps_per_cluster': percentiles(hyps_per_cluster),
+        'cluster_sizes': {str(k): v for k, v in
+                          sorted(Counter(cluster_sizes).items())},
+        'stages': {n: s.as_dict() for n, s in stats.stages.items()},
+        'counters': dict(stats.counters),
+        'final_targets': len(best.targets),
+        'true_targets': scenario.ntargets,
+    }
+
+
+def run_isolated(params, tracker_args):
+    """Run one point in a fresh interpreter, for a per-point peak RSS."""
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--point',
+         json.dumps({'params': params, 'tracker': tracker_args})],
+        check=True, stdout=subprocess.PIPE)
+    return json.loads(out.stdout.decode())
+
+
+def points(sweeps):
+    """Generate scenario parameters, varying one dimension at a time."""
+    if not sweeps:
+        yield dict(DEFAULTS)
+    for dim, values in sweeps:
+        for v in values:
+            params = dict(DEFAULTS)
+            params[dim] = v
+            yield params
+
+
+def environment():
+    """Describe the environment the benchmark ran in."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.decode().strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(old, new):
+    """Print scans/s of matching points in two result files."""
+    def key(r):
+        return json.dumps(r['params'], sort_keys=True)
+    before = {key(r): r for r in old['results']}
+    print("{:<50} {:>10} {:>10} {:>8}".format(
+        'point', 'before', 'after', 'change'))
+    for r in new['results']:
+        b = before.get(key(r))
+        if b is None:
+            continue
+        s0 = b['metrics']['scans_per_s']
+        s1 = r['metrics']['scans_per_s']
+        print("{:<50} {:>10.2f} {:>10.2f} {:>+7.1f}%".format(
+            describe(r['params']), s0, s1, 100 * (s1 / s0 - 1)))
+
+
+def describe(params):
+    """Short description of the non-default parameters."""
+    diff = ["{}={}".format(k, v) for k, v in params.items()
+            if DEFAULTS.get(k) != v]
+    return ", ".join(diff) or "defaults"
+
+
+def parse_sweep(arg):
+    """Parse a DIM=v1,v2,... sweep argument."""
+    if arg == 'all':
+        return list(SWEEPS.items())
+    dim, _, values = arg.partition('=')
+    if dim not in DEFAULTS:
+        raise argparse.ArgumentTypeError("Unknown dimension: " + dim)
+    conv = type(DEFAULTS[dim])
+    return [(dim, [conv(v) for v in values.split(',')] if values
+             else SWEEPS[dim])]
+
+
+def parse_args(*argv):
+    """Parse args."""
+    parser = argparse.ArgumentParser(
+        description="Sweep synthetic scenarios through the tracker.")
+    parser.add_argument('--sweep', type=parse_sweep, action='append',
+                        default=[], metavar='DIM[=V1,V2,...]',
+                        help="dimension to sweep, or 'all' "
+                        "(dimensions: {})".format(", ".join(SWEEPS)))
+    for dim, value in DEFAULTS.items():
+        parser.add_argument('--' + dim, type=type(value), default=value)
+    parser.add_argument('--matching', default="memory")
+    parser.add_argument('--worker-mode', default="pool")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--k-max', type=int, default=100)
+    parser.add_argument('--hp-limit', type=float, default=5)
+    parser.add_argument('--n-scan', type=int, help="N-scan pruning depth")
+    parser.add_argument('--output', help="write JSON results to file")
+    parser.add_argument('--compare', help="compare with earlier results")
+    parser.add_argument('--point', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(*argv):
+    """Main."""
+    args = parse_args(*argv)
+    if args.point:
+        point = json.loads(args.point)
+        print(json.dumps(run_point(point['params'], point['tracker'])))
+        return
+
+    for dim in DEFAULTS:
+        DEFAULTS[dim] = getattr(args, dim)
+    tracker_args = {
+        'matching': args.matching,
+        'worker_mode': args.worker_mode,
+        'workers': args.workers,
+        'k_max': args.k_max,
+        'hp_limit': args.hp_limit,
+        'n_scan': args.n_scan,
+    }
+    results = []
+    print("{:<50} {:>8} {:>10} {:>10} {:>8}".format(
+        'point', 'scans/s', 'p90 scan', 'rss MiB', 'hyps/c'))
+    for params in points([s for sweep in args.sweep for s in sweep]):
+        metrics = run_isolated(params, tracker_args)
+        results.append({'params': params, 'metrics': metrics})
+        rss = metrics['peak_rss_bytes']
+        print("{:<50} {:>8.2f} {:>10.4f} {:>10.1f} {:>8.1f}".format(
+            describe(params), metrics['scans_per_s'],
+            metrics['latency_s']['register_scan']['p90'],
+            (rss['self'] + rss['children']) / 2 ** 20,
+            metrics['hyps_per_cluster'].get('mean', 0)))
+        sys.stdout.flush()
+
+    report = {'environment': environment(), 'tracker': tracker_args,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -15,19 +15,61 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import queue
 from math import log, exp
 import numpy as np
 from itertools import islice
+from operator import itemgetter
 from collections import defaultdict
 # import matplotlib.pyplot as plt
 # from . import plot
 
 from .target import Target
 from .clusterhyp import ClusterHypothesis
-from .hypgen import murty, permgen
-from .utils import PrioItem, connected_components, LARGE
-from .kf import DefaultTargetInit
+from .track import Track
+from .hypgen import gate, kbest_assignments, permgen, MurtySession, \
+    KBestMerge
+from .utils import connected_components, bbox_union, LARGE
+from .kf import DefaultTargetInit, Innovations
+
+
+class ScoreTable:
+    """Per-scan table of track x report match scores.
+
+    The rows of tracks shared between parent hypotheses are computed once,
+    in batches of the tracks not yet in the table. The innovations of the
+    scored pairs are kept for the correction of the chosen assignments.
+    """
+
+    def __init__(self, reports, sensor):
+        """Init."""
+        self.reports = reports
+        self.sensor = sensor
+        self.rows = {}
+        self.innovations = Innovations()
+        self.hits = 0
+        self.misses = 0
+
+    def scores(self, tracks):
+        """Return the len(tracks) x len(reports) match scores."""
+        missing = [tr for tr in tracks if tr not in self.rows]
+        self.hits += len(tracks) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            self.rows.update(zip(missing, Track.match_scores(
+                missing, self.reports, self.sensor, self.innovations)))
+        return np.array([self.rows[tr] for tr in tracks]).reshape(
+            len(tracks), len(self.reports))
+
+    def innovation(self, track, report, filt):
+        """Return the innovation of report for filt, a copy of track.filter.
+
+        Returns None if unknown, or if filt differs from the track filter.
+        """
+        f = track.filter
+        if filt is f or not (np.array_equal(filt.x, f.x)
+                             and np.array_equal(filt.P, f.P)):
+            return None
+        return self.innovations.get(f, report)
 
 
 class ClusterParameters:
@@ -41,6 +83,8 @@ class ClusterParameters:
 ClusterParameters.k_max = 100
 ClusterParameters.hp_limit = LARGE
 ClusterParameters.init_target_tracker = DefaultTargetInit(0.1, 0.1)
+ClusterParameters.seed_murty = True
+ClusterParameters.n_scan = None
 
 
 class Cluster:
@@ -53,6 +97,10 @@ class Cluster:
         self.ambiguous_tracks = []
         self.assigned_reports = set()
         self.params = None
+        self._bbox = None
+        self._ranked = None
+        self._best = None
+        self.score_table = None
         initer(self)
         if self.params is None:
             self.params = ClusterParameters()
@@ -146,9 +194,12 @@ class Cluster:
         """Move to next timestep."""
         for target in self.targets:
             target.predict(dT)
+        self._bbox = None
 
     def normalise(self):
         """Normalise hypothesis scores."""
+        self._ranked = None
+        self._best = None
         if len(self.hypotheses):
             scores = [h.score() for h in self.hypotheses]
             min_score = min(scores)
@@ -156,37 +207,55 @@ class Cluster:
             for h in self.hypotheses:
                 h.total_score += c
 
-    def register_scan(self, scan):
-        """Register scan."""
-        def hlimit(g):
-            """Limit hypothesis draws."""
-            min_score = LARGE
-            scores = []
-            for ph, c, h in islice(g, None, self.params.k_max):
-                scores.append(c)
-                min_score = min(min_score, c)
-                s = log(sum(exp(min_score - s) for s in scores)) - min_score
-                if c + s > self.params.hp_limit:
-                    return
-                yield ph, h
+    def register_scan(self, scan, stats=None):
+        """Register scan.
+
+        If stats is a Counter, the number of reports, parent hypotheses,
+        parent hypotheses drawn from, Murty draws, hypotheses generated,
+        pruned and kept, and score table hits and misses are added to it.
 
+        With params.n_scan set, the decisions made n_scan scans back are
+        committed to, see n_scan_prune, and the track history is kept
+        n_scan scans back. Otherwise no track history is kept.
+        """
         new_ts = {}
+        table = self.score_table = ScoreTable(list(scan.reports), scan.sensor)
+        if stats is not None:
+            stats['reports'] += len(scan.reports)
+            stats['parent_hyps'] += len(self.hypotheses)
 
         # Generate new hyptheses
         self.hypotheses = list(sorted(list({
             ch for ch in
             (ClusterHypothesis.new(ph, hyp, scan.sensor)
-             for ph, hyp in hlimit(self._assignment_hypotheses(scan, new_ts)))
+             for ph, hyp in self._assignment_hypotheses(
+                 scan, new_ts, table, stats))
             if len(ch.tracks) > 0})))
         self.normalise()
+        self.score_table = None
+        n_scan = self.params.n_scan
+        if n_scan is not None:
+            npruned = self.n_scan_prune(n_scan)
+            if stats is not None:
+                stats['hyps_pruned'] += npruned
+        if stats is not None:
+            stats['hyps_kept'] += len(self.hypotheses)
+            stats['score_hits'] += table.hits
+            stats['score_misses'] += table.misses
 
         # Handle created targets and assignments
+        self._bbox = None
         self.targets = list({t for h in self.hypotheses for t in h.targets})
         tracks = {tr for h in self.hypotheses for tr in h.tracks}
         for target in self.targets:
             target.finalize_assignment({tr for tr in tracks
                                         if tr.target is target})
 
+        # Keep the track history that N-scan pruning looks back on
+        depth = n_scan or 0
+        for tr in tracks:
+            tr.history = tr.history[:depth]
+
         # Find tracks from reports that were assigned to multiple targets
         self.ambiguous_tracks = [
             set().union(*(tr.children.values() for tr in atrs)) & tracks
@@ -197,7 +266,43 @@ class Cluster:
             if len({tr.target for tr in r.assigned_tracks}) > 1:
                 self.ambiguous_tracks.append(r.assigned_tracks)
 
-    def _assignment_hypotheses(self, scan, new_targets):
+    def n_scan_prune(self, n):
+        """Prune the hypotheses inconsistent with the best n scans back.
+
+        The ancestors n scans back of the tracks of the best hypothesis are
+        committed to. A hypothesis is removed if it has a track whose
+        ancestor n scans back is not committed to, but belongs to a
+        committed target or has a committed report. Reports are compared by
+        id, which is kept when clusters are serialized. Returns the number
+        of removed hypotheses.
+        """
+        best = self.best_hypothesis()
+        if best is None:
+            return 0
+        committed = {tr.target: tr.ancestor(n) for tr in best.tracks}
+        committed = {t: a for t, a in committed.items() if a is not None}
+        if not committed:
+            return 0
+        nodes = set(committed.values())
+        reports = {rid for _, rid in nodes if rid is not None}
+
+        def consistent(h):
+            """Check that h agrees with the committed tracks."""
+            for tr in h.tracks:
+                a = tr.ancestor(n)
+                if a is not None and a not in nodes \
+                        and (tr.target in committed or a[1] in reports):
+                    return False
+            return True
+
+        hypotheses = [h for h in self.hypotheses if consistent(h)]
+        npruned = len(self.hypotheses) - len(hypotheses)
+        if npruned:
+            self.hypotheses = hypotheses
+            self.normalise()
+        return npruned
+
+    def _assignment_hypotheses(self, scan, new_targets, table, stats=None):
         """Generate cluster hypotheses."""
         def new_target_track(report):
             """Create new target."""
@@ -213,76 +318,93 @@ class Cluster:
                     report, scan.sensor)
             return new_targets[report].tracks[report]
 
-        def get_murties(ph):
-            """Get hypothesis generator for parent hypothesis."""
-            M = len(scan.reports)
-            N = len(ph.tracks)  # Nof targets in hypothesis
+        # The parent hypotheses share reports and most tracks
+        session = MurtySession() if self.params.seed_murty else None
+        M = len(scan.reports)
+        unassigned = np.full(M, scan.sensor.score_extraneous)
 
-            miss_all_score = sum(tr.miss_score(scan.sensor)
-                                 for tr in ph.tracks)
+        '''
+        No assignment costs less than assigning every report to its
+        cheapest track of any parent hypothesis, or every track of the
+        parent hypothesis to its cheapest report, or leaving them unassigned.
+        '''
+        tracks = list(dict.fromkeys(tr for ph in self.hypotheses
+                                    for tr in ph.tracks))
+        miss = dict(zip(tracks, (tr.miss_score(scan.sensor) for tr in tracks)))
+        gain = dict.fromkeys(tracks, 0.0)
+        row_bound = col_bound = unassigned.sum()
+        if M > 0 and tracks:
+            scores = table.scores(tracks)
+            row_bound = np.minimum(unassigned, scores.min(0)).sum()
+            gain.update(zip(tracks, np.minimum(
+                0, (scores - unassigned).min(1)).tolist()))
 
+        def get_murties(ph):
+            """Get the bound and hypothesis generator of ph."""
+            score = ph.score() + sum(map(miss.__getitem__, ph.tracks))
+            bound = max(row_bound,
+                        col_bound + sum(map(gain.__getitem__, ph.tracks)))
+            return score + bound, murties(ph, score)
+
+        def murties(ph, score):
+            """Generate the hypotheses of ph."""
             if M == 0:
-                return iter([(ph.score() + miss_all_score, iter([]))])
+                yield score, (ph, [])
+                return
 
             '''
-            Form C-matrix:  |1 2|
-            1: MxN Cost of assigning measurent r to target c.
-            2: Diagonal MxM cost of extraneous report (new or false).
-            All other values LARGE to be avoided by Murty algorithm.
+            Form sparse MxN C-matrix of the costs of assigning measurement r
+            to target c, for the pairs with a cost below LARGE. All other
+            pairs are forbidden in the Murty algorithm. Leaving a report
+            unassigned (extraneous, new or false) costs score_extraneous.
             '''
-            C = np.empty((M, N + M))
-            C.fill(LARGE)
-            for i, tr in enumerate(ph.tracks):
-                C[range(M), i] = [tr.match_score(r, scan.sensor)
-                                  for r in scan.reports]
-            C[range(M), range(N, N + M)] = scan.sensor.score_extraneous
+            C = gate(table.scores(ph.tracks).T, LARGE)
 
             # Murty solution S: (cost, assignments)
-            return ((ph.score() + S[0] + miss_all_score,
-                     ((r, ph.tracks[a] if a < N else new_target_track(r))
-                      for r, a in zip(scan.reports, S[1])))
-                    for S in murty(C))
-
-        murties = ((ph, get_murties(ph)) for ph in self.hypotheses)
+            for S in kbest_assignments(C, unassigned, session, ph.tracks):
+                yield score + S[0], (ph, S[1])
 
         '''
-        Algorithm description:
-        If all parent hyps has entered the comparison, draw next
-         parent hyp as this may be a candidate to switch to.
-        While current parent hypothesis is cheaper, draw from it
-         children assignments.
+        The parent hypothesis streams are merged in order of cost, and are
+        only drawn from when they may beat the streams already drawn from.
         '''
-        Q = queue.PriorityQueue()
-        ph, m = next(murties)
-        a = next(m)
-        last_item = PrioItem(a[0], (a, ph, m))
-        Q.put(last_item)
-        while not Q.empty():
-            item = Q.get_nowait()
-            if item == last_item:
-                ph, m = next(murties, (None, None))
-                if m:
-                    a = next(m)
-                    last_item = PrioItem(a[0], (a, ph, m))
-                    Q.put(last_item)
-            a, ph, m = item.data
-            next_break = Q.queue[0].prio if not Q.empty() else LARGE
-            while a and a[0] <= next_break:
-                r = list(a[1])
-                yield ph, a[0], r
-                a = next(m, None)
-            if a:
-                Q.put(PrioItem(a[0], (a, ph, m)))
+        merge = KBestMerge(map(get_murties, self.hypotheses),
+                           self.params.k_max, self.params.hp_limit)
+        for _, (ph, S) in merge:
+            yield ph, [(r, ph.tracks[a] if a >= 0 else new_target_track(r))
+                       for r, a in zip(scan.reports, S)]
+        if stats is not None:
+            stats['parents_drawn'] += merge.opened
+            stats['murty_draws'] += merge.pulled
+            stats['hyps_generated'] += merge.emitted
+
+    def ranked_hypotheses(self):
+        """Return (score, hypothesis) tuples ordered by score, cached.
+
+        The ranking is stored with serialized clusters, see mht.serialize.
+        """
+        if self._ranked is None:
+            self._ranked = sorted(((h.score(), h) for h in self.hypotheses),
+                                  key=itemgetter(0))
+        return self._ranked
+
+    def best_hypothesis(self):
+        """Return the best hypothesis, cached."""
+        if self._best is None and self.hypotheses:
+            if self._ranked is not None:
+                self._best = self._ranked[0][1]
+            else:
+                self._best = min(self.hypotheses, key=lambda h: h.score())
+        return self._best
 
     def bbox(self):
-        """Get minimal boundingbox."""
-        # FIXME: Cache!!!
-        bboxes = (tr.bbox()
-                  for t in self.targets for tr in t.tracks.values())
-        minbox = next(bboxes)
-        for bbox in bboxes:
-            minbox = (min(minbox[0], bbox[0]),
-                      max(minbox[1], bbox[1]),
-                      min(minbox[2], bbox[2]),
-                      max(minbox[3], bbox[3]))
-        return minbox
+        """Get minimal boundingbox.
+
+        The box is cached, and recomputed from the cached target boxes
+        after predict and register_scan. Merged and split clusters start
+        without a box, but reuse the boxes of their targets.
+        """
+        if self._bbox is None:
+            self._bbox = bbox_union(t.bbox() for t in self.targets
+                                    if t.tracks)
+        return self._bbox
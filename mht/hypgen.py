@@ -15,47 +15,350 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import queue
-from copy import copy
-import murty as murty_
+import heapq
+from math import exp, log
+from itertools import count, repeat
+from operator import itemgetter
+import numpy as np
+from scipy.sparse import issparse, csr_matrix
 
+from .solvers import SOLVERS, extension, select
 from .utils import LARGE
 
+MURTY_BATCH = 64
+
+
+def murty(C, unassigned=None, msc=True, seed=None, solved=None):
+    """Algorithm due to Murty.
+
+    C is either a dense cost matrix, or a scipy.sparse matrix where the
+    entries not stored are forbidden assignments. If unassigned is given,
+    row i may be left unassigned at cost unassigned[i], which is given as
+    column -1 in the solutions. With msc, partitions are re-solved from the
+    solutions they were partitioned from (Miller, Stone & Cox).
+
+    seed is an optional (x, v) pair with the assignment and column duals of
+    a related solved problem, to start the first solution from, see
+    murty.Murty.seed. solved, if given, is called with the (x, u, v)
+    assignment and duals of the first solution once drawn.
+
+    Solutions are drawn from the extension in batches, doubling in size up
+    to MURTY_BATCH, so that consumers taking only the first few solutions
+    do not pay for more. The extension is imported on first use.
+    """
+    murty_ = extension()
+    if murty_ is None:
+        raise ImportError("The murty extension is not built")
+    if issparse(C):
+        C = C.tocsr().astype(float, copy=False)
+        if not C.has_canonical_format:
+            C = C.copy()
+            C.sum_duplicates()
+    else:
+        C = np.ascontiguousarray(C, dtype=float)
+    if unassigned is None:
+        mgen = murty_.Murty(C)
+    else:
+        mgen = murty_.Murty(C, np.asarray(unassigned, dtype=float))
+    mgen.msc = msc
+    if seed is not None:
+        mgen.seed(*seed)
+    k = 1
+    while True:
+        costs, sols = mgen.draw_k(k)
+        if solved is not None and len(costs):
+            solved(*mgen.first_solution())
+            solved = None
+        yield from zip(costs.tolist(), sols)
+        if len(costs) < k:
+            return None
+        k = min(2 * k, MURTY_BATCH)
+
+
+SOLVERS['murty'] = murty
+
+
+class MurtySession:
+    """Related assignment problems, seeded with each other's solutions.
+
+    The problems share their rows and unassigned costs, and their columns
+    are identified by keys. The first solution of each problem is started
+    from the assignment and column duals last solved for its keys, so that
+    it only needs a few augmentations when the problems are alike.
+    """
+
+    def __init__(self):
+        """Init."""
+        self.assignment = None
+        self.duals = {}
+        self.unassigned_duals = None
+
+    def seed(self, keys):
+        """Return the (x, v) seed for a problem with columns keys."""
+        if self.assignment is None:
+            return None
+        N = len(keys)
+        index = dict(zip(keys, range(N)))
+        index[None] = -1
+        x = np.fromiter(map(index.get, self.assignment, repeat(-2)),
+                        dtype=np.int32, count=len(self.assignment))
+        v = np.concatenate((np.fromiter(map(self.duals.get, keys,
+                                            repeat(0.0)),
+                                        dtype=float, count=N),
+                            self.unassigned_duals))
+        return x, v
+
+    def murty(self, C, unassigned, keys):
+        """Generate assignments of C as murty, seeded from the session."""
+        N = C.shape[1]
+
+        def solved(x, u, v):
+            """Keep the first solution for later problems."""
+            self.assignment = list(map((list(keys) + [None]).__getitem__,
+                                       x.tolist()))
+            self.duals.update(zip(keys, v[:N].tolist()))
+            self.unassigned_duals = v[N:]
+
+        return murty(C, unassigned, seed=self.seed(keys), solved=solved)
+
+
+class _Drawn:
+    """List of the items drawn from an iterator, drawn on demand."""
+
+    def __init__(self, iterable):
+        """Init."""
+        self.iterator = iter(iterable)
+        self.items = []
+
+    def get(self, i):
+        """Return item i, or None if exhausted."""
+        while len(self.items) <= i:
+            item = next(self.iterator, None)
+            if item is None:
+                return None
+            self.items.append(item)
+        return self.items[i]
+
+
+def product(iterables):
+    """Generate the ordered Cartesian product of ordered iterables.
+
+    The iterables yield (cost, data) tuples in increasing cost. Yields
+    (cost, [data, ...]) with the data in the order of the iterables, in
+    increasing total cost. Each combination is generated once: a state
+    differs from its parent in one position, with the positions ordered on
+    the cost difference of their first two items. Items are only drawn from
+    the iterables when a successor needs them.
+    """
+    lists = [_Drawn(it) for it in iterables]
+    if any(l.get(0) is None for l in lists):
+        return
+    cost = sum(l.get(0)[0] for l in lists)
+    order = sorted((p for p, l in enumerate(lists) if l.get(1) is not None),
+                   key=lambda p: lists[p].get(1)[0] - lists[p].get(0)[0])
+    delta = [lists[p].get(1)[0] - lists[p].get(0)[0] for p in order]
+
+    def data(node):
+        """Get the data of the state of node."""
+        index = [0] * len(lists)
+        while node is not None:
+            p, i, node = node
+            index[order[p]] = i
+        return [l.get(i)[1] for l, i in zip(lists, index)]
+
+    Q = []
+    tiebreak = count()
+    node = None
+    while True:
+        if node is None:
+            if order:
+                heapq.heappush(Q, (cost + delta[0], next(tiebreak),
+                                   (0, 1, None)))
+        else:
+            p, i, parent = node
+            lp = lists[order[p]]
+            item = lp.get(i + 1)
+            if item is not None:
+                heapq.heappush(Q, (cost + item[0] - lp.get(i)[0],
+                                   next(tiebreak), (p, i + 1, parent)))
+            if p + 1 < len(order):
+                heapq.heappush(Q, (cost + delta[p + 1], next(tiebreak),
+                                   (p + 1, 1, node)))
+                if i == 1:
+                    heapq.heappush(Q, (cost + delta[p + 1] - delta[p],
+                                       next(tiebreak), (p + 1, 1, parent)))
+        yield cost, data(node)
+        if not Q:
+            return
+        cost, _, node = heapq.heappop(Q)
+
 
 def permgen(lists, presorted=False):
-    """Generate ordered permutations of lists of (cost, data) tuples."""
+    """Generate ordered permutations of lists of (cost, data) tuples.
+
+    Yields ([data, ...], next_cost) in increasing cost, where next_cost is
+    the cost of the next permutation, or None after the last. The
+    permutations are generated by product, so each one is generated once
+    and its cost is updated from the state it is a successor of.
+    """
     if not presorted:
-        lists = [sorted(l) for l in lists]
-    bounds = [len(l) - 1 for l in lists]
-    N = len(lists)
-    Q = queue.PriorityQueue()
-    Q.put((0, [0] * N))
-    prev_cost = 1
-    prev_states = []
-    while not Q.empty():
-        cost, state = Q.get_nowait()
-        if cost == prev_cost:
-            if state in prev_states:
-                continue
-        else:
-            prev_states = []
-        prev_states.append(state)
-        prev_cost = cost
-        for n in range(N):
-            if state[n] < bounds[n]:
-                nstate = copy(state)
-                nstate[n] += 1
-                ncost = sum(l[nstate[i]][0] for i, l in enumerate(lists))
-                Q.put((ncost, nstate))
-        yield ([l[state[n]][1] for n, l in enumerate(lists)],
-               None if Q.empty() else Q.queue[0][0])
-
-
-def murty(C):
-    """Algorithm due to Murty."""
-    mgen = murty_.Murty(C)
+        lists = [sorted(l, key=itemgetter(0)) for l in lists]
+    perms = product(lists)
+    perm = next(perms, None)
+    while perm is not None:
+        following = next(perms, None)
+        yield perm[1], None if following is None else following[0]
+        perm = following
+
+
+class KBestMerge:
+    """Ordered merge of ordered streams of (cost, data) tuples.
+
+    streams is an iterable of (bound, stream) pairs, where bound is a lower
+    bound on the costs of the stream. Iteration stops after k items, or at
+    the first item whose normalised cost is above limit. opened, pulled and
+    emitted count the streams iterated, items drawn and items yielded.
+    """
+
+    def __init__(self, streams, k=None, limit=float('inf')):
+        """Init."""
+        self.streams = streams
+        self.k = k
+        self.limit = limit
+        self.opened = 0
+        self.pulled = 0
+        self.emitted = 0
+
+    def __iter__(self):
+        """Generate the merged items."""
+        tiebreak = count()
+        Q = [(bound, next(tiebreak), stream, None)
+             for bound, stream in self.streams]
+        heapq.heapify(Q)
+        k = float('inf') if self.k is None else self.k
+        if k <= 0:
+            return
+        first = None
+        mass = 0.0
+        while Q:
+            cost, _, stream, item = Q[0]
+            if item is None:
+                stream = iter(stream)
+                self.opened += 1
+            else:
+                if first is None:
+                    first = cost
+                mass += exp(first - cost)
+                if cost + log(mass) - first > self.limit:
+                    return
+                self.emitted += 1
+                yield item
+                if self.emitted >= k:
+                    return
+            item = next(stream, None)
+            if item is None:
+                heapq.heappop(Q)
+            else:
+                self.pulled += 1
+                heapq.heapreplace(Q, (item[0], next(tiebreak), stream, item))
+
+
+def gate(C, limit):
+    """Return dense C as a csr_matrix of the entries below limit."""
+    C = np.asarray(C, dtype=float)
+    mask = C < limit
+    indptr = np.zeros(C.shape[0] + 1, dtype=np.int32)
+    np.cumsum(mask.sum(1), out=indptr[1:])
+    return csr_matrix((C[mask], np.nonzero(mask)[1].astype(np.int32),
+                       indptr), shape=C.shape)
+
+
+def components(C):
+    """Split the sparse matrix C into independent blocks.
+
+    Returns a list of (rows, cols, block) tuples, where block is the
+    csr_matrix C[rows][:, cols], for the connected components of the
+    bipartite graph of the entries of C that have any rows. Labels are
+    propagated between rows and columns until stable.
+    """
+    M, N = C.shape
+    counts = np.diff(C.indptr)
+    entry_rows = np.repeat(np.arange(M), counts)
+    rlabels = np.arange(M)
+    clabels = np.full(N, M)
     while True:
-        ok, cost, sol = mgen.draw()
-        if not ok:
-            return None
-        yield cost, sol
+        np.minimum.at(clabels, C.indices, rlabels[entry_rows])
+        new = rlabels.copy()
+        np.minimum.at(new, entry_rows, clabels[C.indices])
+        if (new == rlabels).all():
+            break
+        rlabels = new
+
+    def groups(labels):
+        """Split indices into groups of equal label, ordered by label."""
+        order = np.argsort(labels, kind='stable')
+        return np.split(order, np.flatnonzero(np.diff(labels[order])) + 1)
+
+    empty = np.empty(0, dtype=int)
+    entry_labels = rlabels[entry_rows]
+    colgroups = {clabels[g[0]]: g for g in groups(clabels) if len(g)}
+    entrygroups = {entry_labels[g[0]]: g for g in groups(entry_labels)
+                   if len(g)}
+    colpos = np.empty(N, dtype=np.int32)
+    blocks = []
+    for rows in groups(rlabels):
+        cols = colgroups.get(rlabels[rows[0]], empty)
+        e = entrygroups.get(rlabels[rows[0]], empty)
+        colpos[cols] = np.arange(len(cols))
+        indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+        np.cumsum(counts[rows], out=indptr[1:])
+        blocks.append((rows, cols, csr_matrix(
+            (C.data[e], colpos[C.indices[e]], indptr),
+            shape=(len(rows), len(cols)))))
+    return blocks
+
+
+def kbest_assignments(C, unassigned, session=None, keys=None):
+    """Generate assignments of the rows of C in increasing cost.
+
+    C is a sparse cost matrix where the entries not stored are forbidden,
+    and row i may be left unassigned (column -1) at cost unassigned[i]. The
+    rows and columns are split into the connected components of the allowed
+    assignments, which are solved independently with the solver selected
+    for their size, see solvers.select, and combined with product. Fully
+    stored matrices are solved as one block. Yields (cost, assignment)
+    tuples.
+
+    If given, single-block problems solved with Murty's algorithm are
+    solved in the MurtySession session, with the columns of C identified
+    by keys.
+    """
+    C = C.tocsr()
+    unassigned = np.asarray(unassigned, dtype=float)
+    M, N = C.shape
+    if M == 1 or C.nnz == M * N:
+        blocks = []
+    else:
+        blocks = components(C)
+    if len(blocks) <= 1:
+        solver = select(C.shape, C.nnz)
+        if solver == 'murty' and session is not None:
+            yield from session.murty(C, unassigned, keys)
+        else:
+            yield from SOLVERS[solver](C, unassigned)
+        return
+
+    def block_draws(rows, cols, block):
+        """Draw block solutions, as column indices of C."""
+        if len(cols) == 0:
+            yield unassigned[rows].sum(), np.full(len(rows), -1)
+            return
+        solver = SOLVERS[select(block.shape, block.nnz)]
+        for cost, sol in solver(block, unassigned[rows]):
+            yield cost, np.where(sol < 0, -1, cols[sol])
+
+    for cost, sols in product(block_draws(*b) for b in blocks):
+        assignment = np.empty(M, dtype=int)
+        for (rows, _, _), sol in zip(blocks, sols):
+            assignment[rows] = sol
+        yield cost, assignment
@@ -15,19 +15,92 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+from collections import defaultdict
 from copy import deepcopy
 from math import log as ln
 from math import sqrt, pi
 from numpy.linalg import det
 import numpy as np
 from numpy.linalg import inv
-from scipy.linalg import block_diag
+from scipy.linalg import block_diag, cho_solve, solve_triangular
 import numbers
 
 from . import models
 from .utils import gaussian_bbox
 
 
+class Innovations:
+    """Innovations of filter/report pairs, from a batched nll computation.
+
+    Stores the measurement matrix, innovation and lower Cholesky factor of
+    the innovation covariance, to be reused by KFilter.correct.
+    """
+
+    def __init__(self):
+        """Init."""
+        self.groups = defaultdict(list)
+
+    def add(self, filters, reports, H, dz, L):
+        """Add a batch of filters x reports."""
+        rpos = {r: b for b, r in enumerate(reports)}
+        for a, f in enumerate(filters):
+            self.groups[f].append((a, rpos, H, dz, L))
+
+    def get(self, f, r):
+        """Return (H, dz, L) for the pair, or None if unknown."""
+        for a, rpos, H, dz, L in self.groups.get(f, ()):
+            b = rpos.get(r)
+            if b is not None:
+                return H[a], dz[a, b, :, 0], L[a, b]
+        return None
+
+
+def nll_matrix(filters, reports, innovations=None):
+    """Get the nll scores of assigning each report to each filter.
+
+    KFilters are scored in batches of reports sharing measurement model,
+    and filters sharing state dimension, using a batched Cholesky
+    factorization of the innovation covariances. Other filters are scored
+    one pair at a time. The factorizations are added to innovations, if
+    given.
+    """
+    scores = np.empty((len(filters), len(reports)))
+    batched = defaultdict(list)
+    for i, f in enumerate(filters):
+        if type(f).nll is KFilter.nll:
+            batched[len(f.x)].append(i)
+        else:
+            scores[i] = [f.nll(r) for r in reports]
+    mfns = defaultdict(list)
+    for j, r in enumerate(reports):
+        mfns[r.mfn].append(j)
+
+    for fidx in batched.values():
+        fs = [filters[i] for i in fidx]
+        P = np.array([f.P for f in fs])
+        for mfn, ridx in mfns.items():
+            zhat, H = zip(*(mfn(f.x) for f in fs))
+            zhat = np.array(zhat)
+            H = np.array(H)
+            z = np.array([reports[j].z for j in ridx])
+            R = np.array([reports[j].R for j in ridx])
+            S = (H @ P @ H.transpose(0, 2, 1))[:, None] + R[None]
+            dz = (z[None] - zhat[:, None])[..., None]
+            try:
+                L = np.linalg.cholesky(S)
+            except np.linalg.LinAlgError:
+                scores[np.ix_(fidx, ridx)] = [
+                    [f.nll(reports[j]) for j in ridx] for f in fs]
+                continue
+            y = np.linalg.solve(L, dz)[..., 0]
+            if innovations is not None:
+                innovations.add(fs, [reports[j] for j in ridx], H, dz, L)
+            logdet = 2 * np.log(np.diagonal(L, axis1=2, axis2=3)).sum(-1)
+            scores[np.ix_(fidx, ridx)] = \
+                (y * y).sum(-1) / 2.0 + ln(2 * pi) + logdet / 2.0
+    return scores
+
+
 class DefaultTargetInit:
     """Default target initiator."""
 
@@ -79,8 +152,23 @@ class KFilter:
 
         self._calc_bbox()
 
-    def correct(self, r):
-        """Perform correction (measurement) update."""
+    def correct(self, r, innovation=None):
+        """Perform correction (measurement) update.
+
+        innovation is an optional (H, dz, L) tuple for the current state,
+        with L the lower Cholesky factor of the innovation covariance.
+        """
+        if innovation is not None:
+            H, dz, L = innovation
+            HP = H @ self.P
+            K = cho_solve((L, True), HP).T
+            self.x += K @ dz
+            self.P -= K @ HP
+            y = solve_triangular(L, dz, lower=True)
+            score = y @ y / 2.0 + ln(2 * pi) + np.log(np.diagonal(L)).sum()
+            self._calc_bbox()
+            return float(score)
+
         zhat, H = r.mfn(self.x)
         dz = r.z - zhat
         S = H @ self.P @ H.T + r.R
@@ -15,14 +15,39 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from itertools import chain, islice
+from time import perf_counter, process_time
+import asyncio
 import sqlite3
-import pickle
+import threading
 import multiprocessing as mp
+import numpy as np
 
 from .cluster import Cluster, ClusterParameters
 from .hypgen import permgen
-from .utils import overlap, gaussian_bbox
+from .profiling import Stats, NOSTATS
+from .shard import ShardPool
+from .spatial import GridIndex
+from . import serialize
+from .utils import overlap, overlap_pairs, gaussian_bbox
+
+
+def report_matches(reports, track_bboxes):
+    """Gate reports against clusters, in one pass over the scan.
+
+    track_bboxes holds the track bboxes of each cluster. Returns, for each
+    report, the set of indices of clusters having an overlapping track.
+    """
+    owners = np.fromiter((n for n, bboxes in enumerate(track_bboxes)
+                          for _ in bboxes), dtype=int)
+    ri, ti = overlap_pairs([r.bbox() for r in reports],
+                           list(chain.from_iterable(track_bboxes)))
+    matches = [set() for _ in reports]
+    for i, n in zip(ri.tolist(), owners[ti].tolist()):
+        matches[i].add(n)
+    return matches
 
 
 def cluster_initer_factory(tracker, cparams):
@@ -41,43 +66,108 @@ def predict_cluster(args):
 
 
 def correct_cluster(args):
-    """Update cluster from multithread process."""
-    (scan, cluster) = args
-    cluster.register_scan(scan)
-    return cluster
+    """Update cluster from multithread process.
+
+    Returns the cluster and, if profiling, a Counter of cluster statistics.
+    """
+    (scan, cluster, profile) = args
+    if not profile:
+        cluster.register_scan(scan)
+        return cluster, None
+    stats = Counter()
+    wall, cpu = perf_counter(), process_time()
+    cluster.register_scan(scan, stats)
+    stats['wall'] = perf_counter() - wall
+    stats['cpu'] = process_time() - cpu
+    return cluster, stats
 
 
 class MHT:
     """MHT class."""
 
     def __init__(self, cparams=None, matching_algorithm=None,
-                 dbfile=':memory:'):
-        """Init."""
+                 dbfile=':memory:', worker_mode="pool", nworkers=None,
+                 compression=None, db_pragmas=None, id_block_size=256,
+                 grid_cell_size=10.0, stats=None):
+        """Init.
+
+        worker_mode is "pool" or "resident" (clusters kept in shard
+        processes), and matching_algorithm "memory" keeps the clusters in
+        process. db_pragmas is a dict of sqlite pragmas and stats an optional
+        mht.Stats object.
+        """
         self.matching_algorithm = matching_algorithm
+        self.stats = stats if stats is not None else NOSTATS
+        self.clusters = {}
+        self.cluster_index = GridIndex(grid_cell_size)
+        self.track_index = GridIndex(grid_cell_size)
         self.cparams = cparams if cparams else ClusterParameters()
         self.cluster_initer = cluster_initer_factory(self, self.cparams)
 
         self.active_clusters = set()
 
+        self.compression = compression
         self.dbfile = dbfile
-        self.dbc = sqlite3.connect(dbfile)
-        self.db = self.dbc.cursor()
-        self._init_db()
-
-        self.mppool = mp.Pool()
+        self.db_pragmas = db_pragmas if db_pragmas else {}
+        self.id_block_size = id_block_size
+        self.db_lock = threading.RLock()
+        self._connect()
+
+        self.worker_mode = worker_mode
+        self.mppool = None
+        self.shards = None
+        self.summaries = {}
+        if worker_mode == "pool":
+            self.mppool = mp.Pool(nworkers)
+        elif worker_mode == "resident":
+            self.shards = ShardPool(nworkers or mp.cpu_count(), self.cparams)
+        else:
+            raise ValueError("Unknown worker mode: {}".format(worker_mode))
         self.npresplit = 0
+        self.nmerges = 0
+        self.nmerges_avoided = 0
+
+    def close(self):
+        """Stop worker processes."""
+        if self.mppool is not None:
+            self.mppool.terminate()
+            self.mppool = None
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
 
     def initiate_clusters(self, initial_targets):
         """Init clusters."""
+        if self.shards is not None:
+            requests = {}
+            for i, f in enumerate(initial_targets):
+                s = i % self.shards.nshards
+                requests.setdefault(s, ('initial', ([],)))[1][0].append(f)
+            self._update_summaries([], self.shards.call(requests).values())
+            return
         self._save_clusters({Cluster.initial(self.cluster_initer, [f])
                              for f in initial_targets})
 
     def _reboot(self):
         """Reboot filter."""
-        self.dbc = sqlite3.connect(self.dbfile)
+        self._connect()
+        self.active_clusters = set()
+
+    def _connect(self):
+        """Connect to database."""
+        self.dbc = sqlite3.connect(self.dbfile, check_same_thread=False)
         self.db = self.dbc.cursor()
+        for name, value in self.db_pragmas.items():
+            self.db.execute("PRAGMA {}={};".format(name, value))
         self._init_db()
-        self.active_clusters = set()
+        self.dirty_clusters = {}
+        self.deleted_clusters = []
+        self.cluster_ids = iter(())
+        if self.matching_algorithm == "memory":
+            self.clusters = {}
+            self.cluster_index.clear()
+            self.track_index.clear()
+            self._index_clusters(self.query_clusters())
 
     def _init_db(self):
         """Init database."""
@@ -94,41 +184,107 @@ class MHT:
             self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cluster_index"
                             " USING rtree(id, min_x, max_x, min_y, max_y);")
 
+    def _reserve_cluster_ids(self):
+        """Reserve a block of cluster ids in the database."""
+        n = self.id_block_size
+        with self.db_lock:
+            row = self.db.execute("SELECT seq FROM sqlite_sequence "
+                                  "WHERE name='clusters';").fetchone()
+            if row is None:
+                (last,) = self.db.execute(
+                    "SELECT IFNULL(MAX(id), 0) FROM clusters;").fetchone()
+                self.db.execute("INSERT INTO sqlite_sequence (name, seq) "
+                                "VALUES ('clusters', ?);", (last + n,))
+            else:
+                (last,) = row
+                self.db.execute("UPDATE sqlite_sequence SET seq=? "
+                                "WHERE name='clusters';", (last + n,))
+            self.dbc.commit()
+        self.cluster_ids = iter(range(last + 1, last + n + 1))
+
     def _new_cluster_id(self):
-        """Insert new row in db and retrieve id."""
-        self.db.execute("INSERT INTO clusters DEFAULT VALUES")
-        return self.db.lastrowid
+        """Retrieve id from the reserved block."""
+        cid = next(self.cluster_ids, None)
+        if cid is None:
+            self._reserve_cluster_ids()
+            cid = next(self.cluster_ids)
+        return cid
+
+    def _mark_dirty(self, clusters):
+        """Mark clusters as changed since they were last saved."""
+        self.dirty_clusters.update((c._id, c) for c in clusters)
+        if self.matching_algorithm == "memory":
+            self._index_clusters(clusters)
+
+    def _index_clusters(self, clusters):
+        """Insert or update clusters in the in-memory index."""
+        for c in clusters:
+            bboxes = [tr.bbox()
+                      for t in c.targets for tr in t.tracks.values()]
+            self.clusters[c._id] = c
+            self.track_index.insert(c._id, bboxes)
+            self.cluster_index.insert(c._id, [c.bbox()] if bboxes else [])
+
+    def _unindex_clusters(self, clusters):
+        """Remove clusters from the in-memory index."""
+        for c in clusters:
+            self.clusters.pop(c._id, None)
+            self.track_index.remove(c._id)
+            self.cluster_index.remove(c._id)
 
     def _add_clusters(self, clusters):
         """Add clusters."""
         self.active_clusters |= clusters
+        self._mark_dirty(clusters)
 
     def _delete_clusters(self, clusters):
-        """Remove clusters."""
+        """Remove clusters.
+
+        The deletion is written with the next _save_clusters.
+        """
         self.active_clusters -= clusters
-        ids = ', '.join(str(c._id) for c in clusters)
-        self.db.execute("DELETE FROM clusters WHERE id IN ({});".format(ids))
-        if self.matching_algorithm == "rtree":
-            self.db.execute("DELETE FROM cluster_index WHERE id IN ({});"
-                            .format(ids))
-        self.dbc.commit()
+        for c in clusters:
+            self.dirty_clusters.pop(c._id, None)
+        if self.matching_algorithm == "memory":
+            self._unindex_clusters(clusters)
+        self.deleted_clusters += [c._id for c in clusters]
 
     def _load_clusters(self, bbox=None):
         """Load clusters."""
-        if self.matching_algorithm is None or bbox is None:
-            self.active_clusters = self.query_clusters()
-        elif self.matching_algorithm == "naive":
-            all_clusters = self.query_clusters()
-            self.active_clusters = {
-                c for c in all_clusters
-                if overlap(c.bbox(), bbox)}
-        else:
-            self.active_clusters = self.query_clusters(bbox)
+        with self.stats.stage('load'):
+            if self.shards is not None:
+                requests = {}
+                for cs in self._resident_summaries(bbox):
+                    requests.setdefault(cs.shard, ('fetch', ([],)))[1][0] \
+                        .append(cs._id)
+                self.active_clusters = set(chain.from_iterable(
+                    self.shards.call(requests).values()))
+            elif self.matching_algorithm == "memory":
+                if bbox is None:
+                    self.active_clusters = set(self.clusters.values())
+                else:
+                    self.active_clusters = {
+                        self.clusters[i]
+                        for i in self.cluster_index.query(bbox)}
+            elif self.matching_algorithm is None or bbox is None:
+                self.active_clusters = self.query_clusters()
+            elif self.matching_algorithm == "naive":
+                all_clusters = self.query_clusters()
+                self.active_clusters = {
+                    c for c in all_clusters
+                    if overlap(c.bbox(), bbox)}
+            else:
+                self.active_clusters = self.query_clusters(bbox)
 
     def query_clusters(self, bbox=None):
         """Get clusters intersecting boundingbox."""
+        with self.db_lock:
+            return self._query_clusters(bbox)
+
+    def _query_clusters(self, bbox):
+        """Query and decode clusters from database."""
         if bbox is None:
-            pickles = self.db.execute("SELECT data FROM clusters")
+            blobs = self.db.execute("SELECT data FROM clusters")
         else:
             def get_clusters(bbox):
                 if self.matching_algorithm == "db":
@@ -153,30 +309,46 @@ class MHT:
                         ";").format(*bbox))
 
             # FIXME: Use multiple queries if around wrapping-points!
-            pickles = get_clusters(bbox)
-        return {pickle.loads(p[0]) for p in pickles}
+            blobs = get_clusters(bbox)
+        return {serialize.loads(b[0], self.cparams) for b in blobs}
 
     def _save_clusters(self, clusters=None):
-        """Store cluster data in database."""
-        if clusters is None:
-            clusters = self.active_clusters
-        if self.matching_algorithm == "rtree":
-            for c in clusters:
-                self.db.execute(("REPLACE INTO cluster_index "
-                                 "(id, min_x, max_x, min_y, max_y) "
-                                 "VALUES ({}, {}, {}, {}, {});"
-                                 ).format(c._id, *c.bbox()))
-        for c in clusters:
-            self.db.execute("UPDATE clusters SET "
-                            "min_x=?, max_x=?, min_y=?, max_y=?, data=? "
-                            "WHERE id=?", c.bbox() + (pickle.dumps(c), c._id))
-        self.dbc.commit()
-
-    def _overlapping_clusters(self, r):
-        """Select clusters within reasonable range."""
-        return {c for c in self.active_clusters
-                if any(overlap(tr.bbox(), r.bbox())
-                       for t in c.targets for tr in t.tracks.values())}
+        """Store dirty cluster data in database, in a single transaction."""
+        if clusters is not None:
+            self._mark_dirty(clusters)
+        self._write_clusters(*self._take_dirty())
+
+    def _take_dirty(self):
+        """Take the pending cluster changes, for writing."""
+        dirty = list(self.dirty_clusters.values())
+        deleted = self.deleted_clusters
+        self.dirty_clusters = {}
+        self.deleted_clusters = []
+        return dirty, deleted
+
+    def _write_clusters(self, dirty, deleted):
+        """Write cluster changes to the database."""
+        with self.stats.stage('serialize'):
+            rows = [(c._id,) + c.bbox() for c in dirty]
+            blobs = [serialize.dumps(c, self.compression) for c in dirty]
+        if self.stats.enabled:
+            for c, blob in zip(dirty, blobs):
+                self.stats.cluster(c._id, {'bytes_serialized': len(blob)})
+        with self.stats.stage('write'), self.db_lock:
+            ids = [(i,) for i in deleted]
+            self.db.executemany("DELETE FROM clusters WHERE id=?;", ids)
+            if self.matching_algorithm == "rtree":
+                self.db.executemany("DELETE FROM cluster_index WHERE id=?;",
+                                    ids)
+                self.db.executemany("REPLACE INTO cluster_index "
+                                    "(id, min_x, max_x, min_y, max_y) "
+                                    "VALUES (?, ?, ?, ?, ?);", rows)
+            self.db.executemany("REPLACE INTO clusters "
+                                "(id, min_x, max_x, min_y, max_y, data) "
+                                "VALUES (?, ?, ?, ?, ?, ?);",
+                                (row + (blob,)
+                                 for row, blob in zip(rows, blobs)))
+            self.dbc.commit()
 
     def _split_clusters(self):
         """Split clusters."""
@@ -190,6 +362,7 @@ class MHT:
             new_clusters |= nc
         self._delete_clusters(old_clusters)
         self.active_clusters = new_clusters
+        self._mark_dirty(new_clusters)
 
     def _merge_clusters(self, clusters):
         """Merge multiple clusters."""
@@ -200,55 +373,312 @@ class MHT:
         self._add_clusters({c})
         return c
 
-    def _cluster(self, scan):
-        """Update clusters."""
-        new_clusters = set()
+    def _correct_args(self, scan):
+        """Load and cluster, and return the arguments for correct_cluster."""
         self._load_clusters(scan.sensor.bbox())
+        with self.stats.stage('cluster'):
+            return [(Scan(scan.sensor, cr), c, self.stats.enabled)
+                    for c, cr in self._cluster(scan)]
 
-        for r in scan.reports:
-            cmatches = self._overlapping_clusters(r)
+    def _corrected(self, results):
+        """Collect corrected clusters and their statistics."""
+        if self.stats.enabled:
+            for c, stats in results:
+                self.stats.cluster(c._id, stats)
+        return {c for c, _ in results}
 
-            if len(cmatches) > 1:
-                cluster = self._merge_clusters(cmatches)
-            elif len(cmatches) == 0:
+    def _cluster(self, scan):
+        """Update clusters.
+
+        Clusters connected through bridging reports are merged once per
+        connected component. nmerges counts the merges done for the scan, and
+        nmerges_avoided the extra merges a report-by-report merge would need.
+        In memory mode, reports are only gated against the clusters the track
+        index finds within the bbox of some report.
+        """
+        new_clusters = set()
+        reports = list(scan.reports)
+        clusters = list(self.active_clusters)
+        if self.matching_algorithm == "memory" and reports:
+            near = set().union(
+                *(self.track_index.query(r.bbox()) for r in reports))
+            clusters = [c for c in clusters if c._id in near]
+        matches = report_matches(reports, [
+            [tr.bbox() for t in c.targets for tr in t.tracks.values()]
+            for c in clusters])
+
+        parent = list(range(len(clusters)))
+
+        def find(n):
+            while parent[n] != n:
+                parent[n] = parent[parent[n]]
+                n = parent[n]
+            return n
+
+        nbridging = 0
+        for ns in matches:
+            roots = {find(n) for n in ns}
+            if len(roots) > 1:
+                nbridging += 1
+                root = min(roots)
+                for n in roots:
+                    parent[n] = root
+
+        components = {}
+        for n in range(len(clusters)):
+            components.setdefault(find(n), []).append(n)
+        owner = {}
+        self.nmerges = 0
+        for ns in components.values():
+            if len(ns) > 1:
+                cluster = self._merge_clusters({clusters[n] for n in ns})
+                self.nmerges += 1
+            else:
+                cluster = clusters[ns[0]]
+            owner.update((n, cluster) for n in ns)
+        self.nmerges_avoided = nbridging - self.nmerges
+
+        assigned = {}
+        for r, ns in zip(reports, matches):
+            if ns:
+                cluster = owner[next(iter(ns))]
+            else:
                 cluster = Cluster.empty(self.cluster_initer)
                 new_clusters.add(cluster)
-            else:
-                (cluster,) = cmatches
 
-            cluster.assigned_reports.add(r)
+            assigned.setdefault(cluster, set()).add(r)
 
         self.active_clusters |= new_clusters
 
         for c in self.active_clusters:
-            a = c.assigned_reports
+            a = c.assigned_reports | assigned.get(c, set())
             c.assigned_reports = set()
             yield (c, a)
 
+    def _update_summaries(self, removed, summaries):
+        """Update the main-side view of resident clusters."""
+        for i in removed:
+            self.summaries.pop(i, None)
+        for cs in chain.from_iterable(summaries):
+            self.summaries[cs._id] = cs
+
+    def _resident_summaries(self, bbox=None):
+        """Select summaries of resident clusters."""
+        if self.matching_algorithm is None or bbox is None:
+            return list(self.summaries.values())
+        return [cs for cs in self.summaries.values()
+                if cs.bbox() is not None and overlap(cs.bbox(), bbox)]
+
+    def _resident_predict(self, dT, bbox):
+        """Perform time update in the shards owning the clusters."""
+        requests = {}
+        for cs in self._resident_summaries(bbox):
+            requests.setdefault(cs.shard, ('predict', ([], dT)))[1][0] \
+                .append(cs._id)
+        self._update_summaries([], self.shards.call(requests).values())
+
+    def _resident_cluster(self, scan):
+        """Group reports and resident clusters, migrating merged clusters."""
+        active = self._resident_summaries(scan.sensor.bbox())
+        group_of = {cs._id: {cs._id} for cs in active}
+        reports = {cs._id: [] for cs in active}
+        new_groups = []
+
+        scan_reports = list(scan.reports)
+        matches = report_matches(scan_reports,
+                                 [cs.track_bboxes for cs in active])
+        for r, ns in zip(scan_reports, matches):
+            cmatches = {active[n]._id for n in ns}
+            groups = {id(group_of[i]): group_of[i] for i in cmatches}
+            if len(groups) > 1:
+                merged = set().union(*groups.values())
+                mreports = []
+                for g in groups.values():
+                    mreports += reports.pop(min(g))
+                for i in merged:
+                    group_of[i] = merged
+                reports[min(merged)] = mreports
+                mreports.append(r)
+            elif len(groups) == 0:
+                new_groups.append([r])
+            else:
+                (g,) = groups.values()
+                reports[min(g)].append(r)
+
+        load = [0] * self.shards.nshards
+        for cs in self.summaries.values():
+            load[cs.shard] += 1
+        assignments = [[] for _ in range(self.shards.nshards)]
+        for key, rs in reports.items():
+            ids = sorted(group_of[key])
+            owners = [self.summaries[i].shard for i in ids]
+            dst = max(set(owners), key=lambda s: (owners.count(s), -s))
+            for src in set(owners) - {dst}:
+                moved = [i for i, s in zip(ids, owners) if s == src]
+                self.shards.migrate(src, dst, moved)
+                for i in moved:
+                    self.summaries[i].shard = dst
+            assignments[dst].append((tuple(ids), rs))
+        for rs in new_groups:
+            dst = load.index(min(load))
+            load[dst] += 1
+            assignments[dst].append(((), rs))
+        return assignments
+
+    def _resident_register_scan(self, scan):
+        """Register scan in the shards owning the clusters."""
+        assignments = self._resident_cluster(scan)
+        results = self.shards.call(
+            {s: ('correct', (a, scan.sensor))
+             for s, a in enumerate(assignments) if a})
+        for removed, summaries in results.values():
+            self._update_summaries(removed, [summaries])
+
     def predict(self, dT, bbox=None):
         """Move to next timestep."""
+        if self.shards is not None:
+            with self.stats.stage('predict'):
+                self._resident_predict(dT, bbox)
+            return
         self._load_clusters(bbox)
-        self.active_clusters = set(
-            self.mppool.map(predict_cluster,
-                            ((c, dT) for c in self.active_clusters)))
-        self._save_clusters()
+        with self.stats.stage('predict'):
+            self.active_clusters = set(
+                self.mppool.map(predict_cluster,
+                                ((c, dT) for c in self.active_clusters)))
+        self._save_clusters(self.active_clusters)
 
     def register_scan(self, scan):
         """Register new scan."""
-        self.active_clusters = set(
-            self.mppool.map(
-                correct_cluster,
-                ((Scan(scan.sensor, cr), c)
-                 for c, cr in self._cluster(scan))))
-        self._split_clusters()
+        if self.shards is not None:
+            with self.stats.stage('correct'):
+                self._resident_register_scan(scan)
+            return
+        args = self._correct_args(scan)
+        with self.stats.stage('correct'):
+            self.active_clusters = self._corrected(
+                self.mppool.map(correct_cluster, args))
+        self._mark_dirty(self.active_clusters)
+        with self.stats.stage('split'):
+            self._split_clusters()
         self._save_clusters()
 
+    async def _pool_map(self, func, iterable):
+        """Await a map over the worker pool."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def done(result):
+            loop.call_soon_threadsafe(future.set_result, result)
+
+        def failed(error):
+            loop.call_soon_threadsafe(future.set_exception, error)
+
+        self.mppool.map_async(func, list(iterable),
+                              callback=done, error_callback=failed)
+        return await future
+
+    async def run(self, source, t0=None, maxsize=2):
+        """Track the (time, scan) tuples of the async iterator source.
+
+        Yields (time, clusters) with the clusters updated by each scan.
+        """
+        if self.mppool is None:
+            raise ValueError("run requires worker_mode 'pool'")
+        loop = asyncio.get_running_loop()
+        scans = asyncio.Queue(maxsize)
+        writes = asyncio.Queue(maxsize)
+        writer = ThreadPoolExecutor(1)
+        errors = []
+
+        async def read():
+            try:
+                async for item in source:
+                    await scans.put(item)
+            except Exception as e:
+                errors.append(e)
+            await scans.put(None)
+
+        async def write():
+            while True:
+                batch = await writes.get()
+                try:
+                    if batch is not None and not errors:
+                        await loop.run_in_executor(
+                            writer, self._write_clusters, *batch)
+                except Exception as e:
+                    errors.append(e)
+                writes.task_done()
+                if batch is None:
+                    return
+
+        async def flush():
+            await writes.put(self._take_dirty())
+            if self.matching_algorithm != "memory":
+                await writes.join()
+            if errors:
+                raise errors[0]
+
+        tasks = [asyncio.ensure_future(read()),
+                 asyncio.ensure_future(write())]
+        try:
+            last = t0
+            while True:
+                item = await scans.get()
+                if item is None:
+                    break
+                t, scan = item
+                if last is not None:
+                    self._load_clusters()
+                    with self.stats.stage('predict'):
+                        self.active_clusters = set(await self._pool_map(
+                            predict_cluster,
+                            ((c, t - last) for c in self.active_clusters)))
+                    self._mark_dirty(self.active_clusters)
+                    if self.matching_algorithm != "memory":
+                        await flush()
+                last = t
+                args = self._correct_args(scan)
+                with self.stats.stage('correct'):
+                    self.active_clusters = self._corrected(
+                        await self._pool_map(correct_cluster, args))
+                self._mark_dirty(self.active_clusters)
+                with self.stats.stage('split'):
+                    self._split_clusters()
+                await flush()
+                yield t, set(self.active_clusters)
+            await writes.put(None)
+            await asyncio.gather(*tasks)
+            if errors:
+                raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.shutdown()
+            if not errors:
+                while not writes.empty():
+                    batch = writes.get_nowait()
+                    if batch is not None:
+                        self._write_clusters(*batch)
+                self._save_clusters()
+
     def global_hypotheses(self, bbox=None):
-        """Return global hypotheses."""
+        """Return global hypotheses, best first."""
+        self._load_clusters(bbox)
+        yield from (GlobalHypothesis(hyps) for hyps, _ in
+                    permgen([c.ranked_hypotheses()
+                             for c in self.active_clusters
+                             if c.hypotheses], True))
+
+    def best_global_hypothesis(self, bbox=None):
+        """Return the best global hypothesis, in O(clusters)."""
         self._load_clusters(bbox)
-        yield from (GlobalHypothesis(hyps) for hyps in
-                    permgen(((h.score(), h) for h in c.hypotheses)
-                            for c in self.active_clusters))
+        return GlobalHypothesis([c.best_hypothesis()
+                                 for c in self.active_clusters
+                                 if c.hypotheses])
+
+    def top_k(self, k, bbox=None):
+        """Return the k best global hypotheses, generated lazily."""
+        return islice(self.global_hypotheses(bbox), k)
 
     def targets(self):
         """Retrieve all targets in tracker."""
@@ -259,14 +689,34 @@ class GlobalHypothesis:
     """Class to represent a global hypothesis."""
 
     def __init__(self, hypotheses):
-        """Init."""
-        self.cluster_hypotheses = hypotheses[0]
-        self.tracks = [tr for h in self.cluster_hypotheses for tr in h.tracks]
-        self.targets = {tr.target for tr in self.tracks}
-        self.total_score = sum(tr.score() for tr in self.tracks)
+        """Init.
+
+        Tracks, targets and score are computed on first use.
+        """
+        self.cluster_hypotheses = hypotheses
+        self._tracks = None
+        self._targets = None
+        self.total_score = None
+
+    @property
+    def tracks(self):
+        """Return the tracks of the hypothesis."""
+        if self._tracks is None:
+            self._tracks = [tr for h in self.cluster_hypotheses
+                            for tr in h.tracks]
+        return self._tracks
+
+    @property
+    def targets(self):
+        """Return the targets of the hypothesis."""
+        if self._targets is None:
+            self._targets = {tr.target for tr in self.tracks}
+        return self._targets
 
     def score(self):
         """Return the total score of the hypothesis."""
+        if self.total_score is None:
+            self.total_score = sum(tr.score() for tr in self.tracks)
         return self.total_score
 
     def __gt__(self, b):
@@ -293,6 +743,8 @@ class Report:
         self.assigned_tracks = set()
         self.source = source
         self.tpos = tpos
+        self._id = self.__class__._counter
+        self.__class__._counter += 1
         self._bbox = gaussian_bbox(self.z[0:2], self.R[0:2, 0:2], 2)
 
     def bbox(self):
@@ -304,6 +756,9 @@ class Report:
         return "R({}, R)".format(self.z.T)
 
 
+Report._counter = 0
+
+
 class Scan:
     """Report container class."""
 
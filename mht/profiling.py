@@ -0,0 +1,162 @@
+"""Tracker instrumentation."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import Counter, defaultdict
+from time import perf_counter, process_time
+
+
+class StageStats:
+    """Accumulated timings of a stage."""
+
+    def __init__(self):
+        """Init."""
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+
+    def add(self, wall, cpu):
+        """Add one timed run of the stage."""
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.max_wall = max(self.max_wall, wall)
+
+    def as_dict(self):
+        """Return stats as a dict."""
+        return {'count': self.count, 'wall': self.wall, 'cpu': self.cpu,
+                'max_wall': self.max_wall}
+
+
+class _Timer:
+    """Context manager timing one run of a stage."""
+
+    __slots__ = ('stats', 'name', 'wall', 'cpu')
+
+    def __init__(self, stats, name):
+        """Init."""
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        """Start timer."""
+        self.wall = perf_counter()
+        self.cpu = process_time()
+        return self
+
+    def __exit__(self, *exc):
+        """Stop timer and record."""
+        self.stats.record(self.name, perf_counter() - self.wall,
+                          process_time() - self.cpu)
+        return False
+
+
+class Stats:
+    """Per-stage and per-cluster statistics of a tracker.
+
+    Stages are timed in wall and CPU time of the main process; the time of
+    the worker processes is recorded per cluster. callback, if given, is
+    called as callback(stage, wall, cpu) after each timed stage.
+    """
+
+    enabled = True
+
+    def __init__(self, callback=None):
+        """Init."""
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        """Clear all statistics."""
+        self.stages = defaultdict(StageStats)
+        self.counters = Counter()
+        self.clusters = defaultdict(Counter)
+
+    def stage(self, name):
+        """Return context manager timing the stage."""
+        return _Timer(self, name)
+
+    def record(self, name, wall, cpu):
+        """Record one run of a stage."""
+        self.stages[name].add(wall, cpu)
+        if self.callback is not None:
+            self.callback(name, wall, cpu)
+
+    def count(self, name, n=1):
+        """Increase a counter."""
+        self.counters[name] += n
+
+    def cluster(self, cluster_id, counts):
+        """Add counts for a cluster, also to the totals."""
+        self.clusters[cluster_id].update(counts)
+        self.counters.update(counts)
+
+    def as_dict(self):
+        """Return statistics as a dict of plain types."""
+        return {
+            'stages': {n: s.as_dict() for n, s in self.stages.items()},
+            'counters': dict(self.counters),
+            'clusters': {i: dict(c) for i, c in self.clusters.items()},
+        }
+
+    def __str__(self):
+        """Return a table of the stage timings and counters."""
+        lines = ["{:<16} {:>8} {:>10} {:>10} {:>10}".format(
+            'stage', 'count', 'wall', 'cpu', 'max wall')]
+        for name, s in sorted(self.stages.items(), key=lambda i: -i[1].wall):
+            lines.append("{:<16} {:>8} {:>10.4f} {:>10.4f} {:>10.4f}".format(
+                name, s.count, s.wall, s.cpu, s.max_wall))
+        for name, n in sorted(self.counters.items()):
+            lines.append("{:<16} {:>8g}".format(name, n))
+        return "\n".join(lines)
+
+
+class _NullTimer:
+    """Context manager doing nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        """Do nothing."""
+        return self
+
+    def __exit__(self, *exc):
+        """Do nothing."""
+        return False
+
+
+class NullStats:
+    """Statistics object used when instrumentation is disabled."""
+
+    enabled = False
+    _timer = _NullTimer()
+
+    def stage(self, name):
+        """Return a context manager doing nothing."""
+        return self._timer
+
+    def record(self, name, wall, cpu):
+        """Do nothing."""
+
+    def count(self, name, n=1):
+        """Do nothing."""
+
+    def cluster(self, cluster_id, counts):
+        """Do nothing."""
+
+
+NOSTATS = NullStats()
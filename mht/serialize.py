@@ -0,0 +1,428 @@
+"""Compact binary cluster format."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+'''
+Layout: a fixed header followed by a (possibly compressed) body.
+
+    header: magic b'MHTC', uint16 format version, uint8 codec
+    body:   uint32 number of sections, then for each section
+            16 byte name, 3 byte numpy dtype string, uint8 ndim,
+            ndim x uint32 shape, raw array data
+
+All numeric data (states, covariances, traces, scores and the
+hypothesis-to-track index tables) is stored in contiguous arrays. Objects
+that have no numeric representation (motion models, measurement functions,
+report sources) are stored once each in a small pickled object table.
+The track history, hypothesis ranking and report id sections are optional;
+missing histories are left empty and missing report ids are assigned anew.
+'''
+
+import pickle
+import struct
+import types
+from itertools import accumulate
+from math import prod
+import bz2
+import lzma
+import zlib
+import numpy as np
+
+from .cluster import Cluster, ClusterParameters
+from .clusterhyp import ClusterHypothesis
+from .target import Target
+from .track import Track
+from .kf import KFilter
+
+MAGIC = b'MHTC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHB')
+SECTION = struct.Struct('<16s3sB')
+
+CODECS = {
+    None: (0, None, None),
+    'zlib': (1, zlib.compress, zlib.decompress),
+    'bz2': (2, bz2.compress, bz2.decompress),
+    'lzma': (3, lzma.compress, lzma.decompress),
+}
+DECOMPRESSORS = {cid: dec for cid, _, dec in CODECS.values()}
+
+
+def _objkey(o):
+    """Get a key under which equal objects are stored only once."""
+    if isinstance(o, (types.FunctionType, types.BuiltinFunctionType, type)) \
+            or not hasattr(o, '__dict__'):
+        try:
+            hash(o)
+            return ('v', type(o), o)
+        except TypeError:
+            return ('id', id(o))
+    try:
+        key = ('d', type(o), tuple(sorted(vars(o).items())))
+        hash(key)
+        return key
+    except TypeError:
+        return ('id', id(o))
+
+
+class _Encoder:
+    """Flatten a cluster into index tables."""
+
+    def __init__(self):
+        """Init."""
+        self.objects = []
+        self.objindex = {}
+        self.reports = []
+        self.repindex = {}
+        self.tracks = []
+        self.trindex = {}
+
+    def obj(self, o):
+        """Return index of object in object table."""
+        key = _objkey(o)
+        if key not in self.objindex:
+            self.objindex[key] = len(self.objects)
+            self.objects.append(o)
+        return self.objindex[key]
+
+    def report(self, r):
+        """Return index of report in report table."""
+        if r is None:
+            return -1
+        if id(r) not in self.repindex:
+            self.repindex[id(r)] = len(self.reports)
+            self.reports.append(r)
+        return self.repindex[id(r)]
+
+    def track(self, tr):
+        """Return index of track in track table."""
+        if id(tr) not in self.trindex:
+            self.trindex[id(tr)] = len(self.tracks)
+            self.tracks.append(tr)
+            for c in tr.children.values():
+                self.track(c)
+        return self.trindex[id(tr)]
+
+
+def _ragged(seqs, dtype):
+    """Pack a list of sequences as lengths and concatenated values."""
+    lengths = np.array([len(s) for s in seqs], dtype=np.int64)
+    values = np.fromiter((v for s in seqs for v in s), dtype=dtype,
+                         count=int(lengths.sum()))
+    return lengths, values
+
+
+def _unragged(lengths, values):
+    """Split concatenated values by lengths."""
+    lengths = lengths.tolist()
+    return [values[e - n:e]
+            for n, e in zip(lengths, accumulate(lengths))]
+
+
+def _vectors(dims, values):
+    """Split concatenated vectors of the given dimensions."""
+    if len(dims) and (dims == dims[0]).all():
+        return list(values.copy().reshape(-1, dims[0]))
+    return _unragged(dims, values.copy())
+
+
+def _matrices(dims, values):
+    """Split concatenated square matrices of the given dimensions."""
+    if len(dims) and (dims == dims[0]).all():
+        return list(values.copy().reshape(-1, dims[0], dims[0]))
+    return [m.reshape(d, d)
+            for m, d in zip(_unragged(dims ** 2, values.copy()), dims)]
+
+
+def _flat(arrays, dtype=np.float64):
+    """Concatenate arrays into one flat array."""
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate([np.asarray(a, dtype=dtype).ravel()
+                           for a in arrays])
+
+
+def _pack(cluster):
+    """Convert cluster into a dict of arrays."""
+    enc = _Encoder()
+    targets = list(cluster.targets)
+    tgindex = {id(t): i for i, t in enumerate(targets)}
+    target_tracks = [[enc.track(tr) for tr in t.tracks.values()]
+                     for t in targets]
+    hyp_tracks = [[enc.track(tr) for tr in h.tracks]
+                  for h in cluster.hypotheses]
+    ambiguous = [[enc.track(tr) for tr in atrs]
+                 for atrs in cluster.ambiguous_tracks]
+    assigned = [enc.report(r) for r in cluster.assigned_reports]
+
+    tracks = enc.tracks
+    for tr in tracks:
+        if id(tr.target) not in tgindex:
+            tgindex[id(tr.target)] = len(targets)
+            targets.append(tr.target)
+
+    kfs = [tr.filter for tr in tracks if type(tr.filter) is KFilter]
+    a = {}
+    a['cluster'] = np.array([cluster._id], dtype=np.int64)
+    a['target_id'] = np.array([t._id for t in targets], dtype=np.int64)
+    a['target_ntracks'], a['target_tracks'] = _ragged(target_tracks,
+                                                      np.int64)
+    a['hyp_score'] = np.array([h.total_score for h in cluster.hypotheses],
+                              dtype=np.float64)
+    a['hyp_ntracks'], a['hyp_tracks'] = _ragged(hyp_tracks, np.int64)
+    hypindex = {id(h): i for i, h in enumerate(cluster.hypotheses)}
+    a['hyp_rank'] = np.array([hypindex[id(h)]
+                              for _, h in cluster.ranked_hypotheses()],
+                             dtype=np.int64)
+    a['amb_ntracks'], a['amb_tracks'] = _ragged(ambiguous, np.int64)
+    a['assigned_reports'] = np.array(assigned, dtype=np.int64)
+
+    a['track_int'] = np.array([
+        (tgindex[id(tr.target)],
+         -1 if tr.parent_id is None else tr.parent_id,
+         enc.report(tr.report),
+         tr._trid, tr._id, tr.trlen, tr.exist_score,
+         enc.obj(tr.filter) if type(tr.filter) is not KFilter else -1)
+        for tr in tracks], dtype=np.int64).reshape(-1, 8)
+    a['track_score'] = np.array([(tr.my_score, tr.parent_score)
+                                 for tr in tracks],
+                                dtype=np.float64).reshape(-1, 2)
+    a['track_nsources'], a['track_sources'] = _ragged(
+        [[enc.obj(s) for s in tr.sources] for tr in tracks], np.int64)
+    a['track_nhistory'], a['track_history'] = _ragged(
+        [[v for trid, r in tr.history for v in (trid, -1 if r is None else r)]
+         for tr in tracks], np.int64)
+    a['track_nchildren'], a['track_children'] = _ragged(
+        [[v for r, c in tr.children.items()
+          for v in (enc.report(r), enc.track(c))] for tr in tracks],
+        np.int64)
+
+    a['kf_dim'] = np.array([len(f.x) for f in kfs], dtype=np.int64)
+    a['kf_model'] = np.array([enc.obj(f.model) for f in kfs],
+                             dtype=np.int64)
+    a['kf_bbox'] = np.array([f._bbox for f in kfs],
+                            dtype=np.float64).reshape(-1, 4)
+    a['kf_ntrace'] = np.array([len(f.trace) for f in kfs], dtype=np.int64)
+    # The current state is normally the same object as the last trace entry
+    alias = [bool(f.trace) and f.trace[-1][0] is f.x
+             and f.trace[-1][1] is f.P for f in kfs]
+    a['kf_alias'] = np.array(alias, dtype=np.bool_)
+    a['kf_x'] = _flat([f.x for f, al in zip(kfs, alias) if not al])
+    a['kf_P'] = _flat([f.P for f, al in zip(kfs, alias) if not al])
+    a['kf_trace_x'] = _flat([x for f in kfs for x, _ in f.trace])
+    a['kf_trace_P'] = _flat([P for f in kfs for _, P in f.trace])
+
+    reports = enc.reports
+    a['report_dim'] = np.array([len(r.z) for r in reports], dtype=np.int64)
+    a['report_id'] = np.array([r._id for r in reports], dtype=np.int64)
+    a['report_obj'] = np.array([(enc.obj(r.mfn), enc.obj(r.source),
+                                 enc.obj(r.tpos)) for r in reports],
+                               dtype=np.int64).reshape(-1, 3)
+    a['report_z'] = _flat([r.z for r in reports])
+    a['report_R'] = _flat([r.R for r in reports])
+    a['report_bbox'] = np.array([r._bbox for r in reports],
+                                dtype=np.float64).reshape(-1, 4)
+    a['report_assigned'] = np.array([
+        (i, enc.trindex[id(tr)]) for i, r in enumerate(reports)
+        for tr in r.assigned_tracks if id(tr) in enc.trindex],
+        dtype=np.int64).reshape(-1, 2)
+
+    a['objects'] = np.frombuffer(
+        pickle.dumps(enc.objects, pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+    return a
+
+
+def _unpack(a, params):
+    """Rebuild cluster from a dict of arrays."""
+    from .mht import Report
+
+    objects = pickle.loads(a['objects'].tobytes())
+
+    cluster = Cluster.__new__(Cluster)
+    cluster._id = int(a['cluster'][0])
+    cluster.params = params
+    cluster._bbox = None
+    cluster.score_table = None
+
+    cluster_targets = len(a['target_ntracks'])
+    targets = []
+    for tid in a['target_id'].tolist():
+        t = Target.__new__(Target)
+        t._id = tid
+        t.cluster = cluster
+        t.tracks = {}
+        t.new_tracks = {}
+        t._bbox = None
+        targets.append(t)
+
+    reports = []
+    zs = _vectors(a['report_dim'], a['report_z'])
+    Rs = _matrices(a['report_dim'], a['report_R'])
+    for (mfn, source, tpos), z, R, bbox in zip(
+            a['report_obj'].tolist(), zs, Rs, a['report_bbox'].tolist()):
+        r = Report.__new__(Report)
+        r.z = z
+        r.R = R
+        r.mfn = objects[mfn]
+        r.source = objects[source]
+        r.tpos = objects[tpos]
+        r.assigned_tracks = set()
+        r._bbox = tuple(bbox)
+        reports.append(r)
+    if 'report_id' in a:
+        for r, rid in zip(reports, a['report_id'].tolist()):
+            r._id = rid
+    else:
+        for r in reports:
+            r._id = Report._counter
+            Report._counter += 1
+
+    own = a['kf_dim'][~a['kf_alias']]
+    kf_x = iter(_vectors(own, a['kf_x']))
+    kf_P = iter(_matrices(own, a['kf_P']))
+    trace_dims = np.repeat(a['kf_dim'], a['kf_ntrace'])
+    trace_x = _vectors(trace_dims, a['kf_trace_x'])
+    trace_P = _matrices(trace_dims, a['kf_trace_P'])
+    filters = []
+    k = 0
+    for model, ntrace, alias, bbox in zip(
+            a['kf_model'].tolist(), a['kf_ntrace'].tolist(),
+            a['kf_alias'].tolist(), a['kf_bbox'].tolist()):
+        f = KFilter.__new__(KFilter)
+        f.model = objects[model]
+        f.trace = [(trace_x[j], trace_P[j])
+                   for j in range(k, k + ntrace)]
+        f.x, f.P = f.trace[-1] if alias else (next(kf_x), next(kf_P))
+        f._bbox = tuple(bbox)
+        k += ntrace
+        filters.append(f)
+
+    tracks = []
+    kfs = iter(filters)
+    sources = _unragged(a['track_nsources'], a['track_sources'])
+    for (tg, parent_id, rep, trid, _id, trlen, exist, fobj), \
+            (my_score, parent_score), srcs in zip(
+                a['track_int'].tolist(), a['track_score'].tolist(),
+                sources):
+        tr = Track.__new__(Track)
+        tr.target = targets[tg]
+        tr.parent_id = None if parent_id < 0 else parent_id
+        tr.filter = next(kfs) if fobj < 0 else objects[fobj]
+        tr.report = reports[rep] if rep >= 0 else None
+        tr.my_score = my_score
+        tr.parent_score = parent_score
+        tr.exist_score = exist
+        tr._trid = trid
+        tr._id = _id
+        tr.trlen = trlen
+        tr.sources = {objects[s] for s in srcs.tolist()}
+        tracks.append(tr)
+
+    for tr in tracks:
+        tr.history = ()
+    if 'track_history' in a:
+        for tr, history in zip(tracks, _unragged(a['track_nhistory'],
+                                                 a['track_history'])):
+            history = history.tolist()
+            tr.history = tuple(
+                (trid, r if r >= 0 else None)
+                for trid, r in zip(history[0::2], history[1::2]))
+    for tr, children in zip(tracks, _unragged(a['track_nchildren'],
+                                              a['track_children'])):
+        children = children.tolist()
+        tr.children = {reports[r] if r >= 0 else None: tracks[c]
+                       for r, c in zip(children[0::2], children[1::2])}
+
+    for t, trs in zip(targets, _unragged(a['target_ntracks'],
+                                         a['target_tracks'])):
+        t.tracks = {tracks[i].report: tracks[i] for i in trs.tolist()}
+    for r, tr in a['report_assigned'].tolist():
+        reports[r].assigned_tracks.add(tracks[tr])
+
+    cluster.targets = targets[:cluster_targets]
+    cluster.hypotheses = []
+    for score, trs in zip(a['hyp_score'].tolist(),
+                          _unragged(a['hyp_ntracks'], a['hyp_tracks'])):
+        h = ClusterHypothesis.__new__(ClusterHypothesis)
+        h.tracks = [tracks[i] for i in trs.tolist()]
+        h.targets = {tr.target for tr in h.tracks}
+        h.total_score = score
+        cluster.hypotheses.append(h)
+    cluster._ranked = None
+    cluster._best = None
+    if 'hyp_rank' in a:
+        cluster._ranked = [(h.total_score, h) for h in
+                           map(cluster.hypotheses.__getitem__,
+                               a['hyp_rank'].tolist())]
+        cluster._best = cluster._ranked[0][1] if cluster._ranked else None
+    cluster.ambiguous_tracks = [
+        {tracks[i] for i in trs.tolist()}
+        for trs in _unragged(a['amb_ntracks'], a['amb_tracks'])]
+    cluster.assigned_reports = {reports[i]
+                                for i in a['assigned_reports'].tolist()}
+    return cluster
+
+
+def dumps(cluster, compression=None):
+    """Serialize cluster to bytes.
+
+    compression is one of None, 'zlib', 'bz2' or 'lzma'.
+    """
+    codec, compress, _ = CODECS[compression]
+    arrays = _pack(cluster)
+    parts = [struct.pack('<I', len(arrays))]
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        parts.append(SECTION.pack(name.encode(), arr.dtype.str.encode(),
+                                  arr.ndim) +
+                     struct.pack('<{}I'.format(arr.ndim), *arr.shape))
+        parts.append(arr.tobytes())
+    body = b''.join(parts)
+    if compress is not None:
+        body = compress(body)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, codec) + body
+
+
+def loads(data, params=None):
+    """Deserialize cluster from bytes.
+
+    Cluster parameters are not part of the format, and are attached to the
+    loaded cluster from params.
+    """
+    magic, version, codec = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a serialized cluster")
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported cluster format version: {}"
+                         .format(version))
+    body = memoryview(data)[HEADER.size:]
+    if DECOMPRESSORS[codec] is not None:
+        body = memoryview(DECOMPRESSORS[codec](body))
+
+    arrays = {}
+    (nsections,) = struct.unpack_from('<I', body)
+    pos = 4
+    for _ in range(nsections):
+        name, dtype, ndim = SECTION.unpack_from(body, pos)
+        pos += SECTION.size
+        shape = struct.unpack_from('<{}I'.format(ndim), body, pos)
+        pos += 4 * ndim
+        dtype = np.dtype(dtype.decode())
+        size = dtype.itemsize * prod(shape)
+        arrays[name.rstrip(b'\0').decode()] = np.frombuffer(
+            body[pos:pos + size], dtype=dtype).reshape(shape)
+        pos += size
+    return _unpack(arrays, params if params else ClusterParameters())
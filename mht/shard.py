@@ -0,0 +1,180 @@
+"""Cluster-resident worker processes."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from itertools import count
+import multiprocessing as mp
+
+from .cluster import Cluster
+
+
+class ClusterSummary:
+    """Small description of a cluster living in a shard."""
+
+    def __init__(self, cluster, shard):
+        """Init."""
+        self._id = cluster._id
+        self.shard = shard
+        self.track_bboxes = [tr.bbox() for t in cluster.targets
+                             for tr in t.tracks.values()]
+        self._bbox = cluster.bbox() if self.track_bboxes else None
+
+    def bbox(self):
+        """Return cluster bbox, or None for clusters without tracks."""
+        return self._bbox
+
+    def __repr__(self):
+        """Return string representation of summary."""
+        return "CS({}@{})".format(self._id, self.shard)
+
+
+class ClusterShard:
+    """Worker-side owner of a fixed set of clusters."""
+
+    def __init__(self, index, nshards, cparams):
+        """Init."""
+        self.index = index
+        self.cparams = cparams
+        self.clusters = {}
+        # Strided ids are unique across all shards without coordination
+        self.ids = count(index, nshards)
+
+    def initer(self, cluster):
+        """Cluster initer for clusters created in this shard."""
+        cluster._id = next(self.ids)
+        cluster.params = self.cparams
+
+    def _summarise(self, clusters):
+        """Register clusters and summarise them."""
+        for c in clusters:
+            self.clusters[c._id] = c
+        return [ClusterSummary(c, self.index) for c in clusters]
+
+    def initial(self, filters):
+        """Create initial clusters, one per target filter."""
+        return self._summarise(
+            [Cluster.initial(self.initer, [f]) for f in filters])
+
+    def predict(self, ids, dT):
+        """Perform time update on clusters."""
+        clusters = [self.clusters[i] for i in ids]
+        for c in clusters:
+            c.predict(dT)
+        return self._summarise(clusters)
+
+    def correct(self, assignments, sensor):
+        """Merge, correct and split clusters.
+
+        assignments is a list of (cluster ids, reports), where an empty
+        id tuple creates a new empty cluster for the reports.
+        """
+        from .mht import Scan
+
+        removed = []
+        clusters = []
+        for ids, reports in assignments:
+            if len(ids) == 0:
+                c = Cluster.empty(self.initer)
+            elif len(ids) == 1:
+                c = self.clusters[ids[0]]
+            else:
+                c = Cluster.merge(self.initer,
+                                  [self.clusters.pop(i) for i in ids])
+                removed += ids
+            c.register_scan(Scan(sensor, reports))
+            nc = c.split(self.initer)
+            if nc != {c}:
+                self.clusters.pop(c._id, None)
+                removed.append(c._id)
+            clusters += nc
+        return removed, self._summarise(clusters)
+
+    def take(self, ids):
+        """Remove clusters from shard, for migration."""
+        return [self.clusters.pop(i) for i in ids]
+
+    def put(self, clusters):
+        """Adopt migrated clusters."""
+        for c in clusters:
+            self.clusters[c._id] = c
+
+    def fetch(self, ids=None):
+        """Return copies of clusters."""
+        if ids is None:
+            return list(self.clusters.values())
+        return [self.clusters[i] for i in ids]
+
+
+def shard_worker(conn, index, nshards, cparams):
+    """Serve shard requests until told to stop."""
+    shard = ClusterShard(index, nshards, cparams)
+    while True:
+        cmd, args = conn.recv()
+        if cmd == 'stop':
+            conn.close()
+            return
+        try:
+            conn.send((True, getattr(shard, cmd)(*args)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+class ShardPool:
+    """Main-side handle to a set of cluster-resident workers."""
+
+    def __init__(self, nshards, cparams):
+        """Init."""
+        self.nshards = nshards
+        self.conns = []
+        self.procs = []
+        for i in range(nshards):
+            parent, child = mp.Pipe()
+            p = mp.Process(target=shard_worker,
+                           args=(child, i, nshards, cparams),
+                           daemon=True)
+            p.start()
+            self.conns.append(parent)
+            self.procs.append(p)
+
+    def call(self, requests):
+        """Send {shard: (cmd, args)} requests and wait for all replies."""
+        for s, req in requests.items():
+            self.conns[s].send(req)
+        results = {}
+        error = None
+        for s in requests:
+            ok, res = self.conns[s].recv()
+            if ok:
+                results[s] = res
+            elif error is None:
+                error = res
+        if error is not None:
+            raise error
+        return results
+
+    def migrate(self, src, dst, ids):
+        """Move clusters between shards."""
+        (clusters,) = self.call({src: ('take', (ids,))}).values()
+        self.call({dst: ('put', (clusters,))})
+
+    def close(self):
+        """Stop all workers."""
+        for conn in self.conns:
+            conn.send(('stop', ()))
+        for p in self.procs:
+            p.join()
+        self.conns = []
+        self.procs = []
@@ -0,0 +1,279 @@
+"""Assignment solver backends."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import heapq
+import time
+from itertools import count, islice
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import issparse
+
+_extension = None
+
+'''
+Solvers yield the (cost, assignment) solutions of a cost matrix C, where row
+i may be left unassigned (column -1) at cost unassigned[i], in increasing
+cost. The 'murty' solver is registered by hypgen.
+'''
+SOLVERS = {}
+
+'''
+Matrix sizes, in stored and forbidden entries of C, where the solvers take
+over from Murty's algorithm, see select. Set on the host by calibrate.
+'''
+THRESHOLDS = {
+    'scipy': 0,  # Largest size solved with scipy
+    'auction': float('inf'),  # Smallest size of square matrices for auction
+    'density': 0.5,  # Smallest fraction of stored entries of dense matrices
+}
+
+
+def extension():
+    """Return the murty extension module, or None if it is not built."""
+    global _extension
+    if _extension is None:
+        try:
+            import murty
+            _extension = murty
+        except ImportError:
+            _extension = False
+    return _extension or None
+
+
+def available():
+    """Return the names of the solvers that can be used."""
+    return [name for name in SOLVERS
+            if name != 'murty' or extension() is not None]
+
+
+def select(shape, nnz=None, unassigned=True):
+    """Select the solver for a matrix of shape with nnz stored entries.
+
+    unassigned tells if rows may be left unassigned. Auction is only used
+    for dense square matrices where they may not, which the tracker never
+    produces. Without the murty extension, scipy takes over from Murty's
+    algorithm.
+    """
+    size = shape[0] * shape[1]
+    dense = nnz is None or nnz >= THRESHOLDS['density'] * size
+    if dense and not unassigned and shape[0] == shape[1] \
+            and size >= THRESHOLDS['auction']:
+        return 'auction'
+    if size <= THRESHOLDS['scipy'] or extension() is None:
+        return 'scipy'
+    return 'murty'
+
+
+def _expand(C, unassigned):
+    """Return C as a dense array, with inf for the forbidden entries.
+
+    The unassigned costs are added as columns, where row i may only be
+    assigned to column N + i.
+    """
+    M, N = C.shape
+    if issparse(C):
+        C = C.tocoo()
+        D = np.full((M, N), np.inf)
+        D[C.row, C.col] = 0
+        np.add.at(D, (C.row, C.col), C.data)
+    else:
+        D = np.array(C, dtype=float)
+    if unassigned is not None:
+        U = np.full((M, M), np.inf)
+        U[range(M), range(M)] = unassigned
+        D = np.hstack((D, U))
+    return D
+
+
+def lap_kbest(C, unassigned, lap):
+    """Algorithm due to Murty, solving every partition with lap.
+
+    lap(D) returns the columns assigned to the rows of the dense cost
+    matrix D, or None if every assignment has an infinite cost. The
+    partitions are solved from scratch when created, and the rows of a
+    partition are fixed to the solution it is partitioned from in order.
+    """
+    M, N = C.shape
+    D = _expand(C, unassigned)
+    if M > D.shape[1]:
+        return
+    rows = np.arange(M)
+
+    def solve(D):
+        """Return the (cost, solution) of D, or None."""
+        x = lap(D)
+        if x is None:
+            return None
+        return float(D[rows, x].sum()), x
+
+    solution = solve(D)
+    if solution is None:
+        return
+    tiebreak = count()
+    Q = [(solution[0], next(tiebreak), solution[1], D, 0)]
+    while Q:
+        cost, _, x, D, start = heapq.heappop(Q)
+        yield cost, np.where(x < N, x, -1)
+        for i in range(start, M):
+            child = D.copy()
+            child[i, x[i]] = np.inf
+            solution = solve(child)
+            if solution is not None:
+                heapq.heappush(Q, (solution[0], next(tiebreak), solution[1],
+                                   child, i))
+            fixed = D[i, x[i]]
+            D[i, :] = np.inf
+            D[:, x[i]] = np.inf
+            D[i, x[i]] = fixed
+
+
+def scipy_lap(D):
+    """Solve the dense assignment problem D with scipy."""
+    try:
+        return linear_sum_assignment(D)[1]
+    except ValueError:
+        return None
+
+
+def auction_lap(D, tol=1e-9):
+    """Solve the square assignment problem D with the auction algorithm.
+
+    All unassigned rows bid at once (Jacobi), with epsilon scaling down to
+    tol times the range of the costs over the number of columns, so that
+    the solution costs at most tol times the range more than the optimum.
+    Forbidden entries get a cost that no feasible assignment can beat.
+    """
+    M, N = D.shape
+    if M != N:
+        raise ValueError("The auction only solves square problems")
+    if M == 0:
+        return np.zeros(0, dtype=int)
+    finite = np.isfinite(D)
+    if not finite.any(1).all():
+        return None
+    low = D[finite].min()
+    span = max(D[finite].max() - low, 1.0)
+    A = np.where(finite, low - D, -(span + 1) * (N + 1))
+    if N == 1:
+        return np.zeros(1, dtype=int)
+    prices = np.zeros(N)
+    owner = np.empty(N, dtype=int)
+    x = np.empty(N, dtype=int)
+    eps_min = tol * span / N
+    eps = span / 4
+    while True:
+        owner[:] = -1
+        x[:] = -1
+        free = np.arange(N)
+        while len(free):
+            values = A[free] - prices
+            best = values.argmax(1)
+            bidders = np.arange(len(free))
+            first = values[bidders, best]
+            values[bidders, best] = -np.inf
+            bids = prices[best] + first - values.max(1) + eps
+            order = np.lexsort((-bids, best))
+            won = order[np.r_[True, np.diff(best[order]) != 0]]
+            cols = best[won]
+            outbid = owner[cols]
+            x[outbid[outbid >= 0]] = -1
+            owner[cols] = free[won]
+            x[free[won]] = cols
+            prices[cols] = bids[won]
+            free = np.flatnonzero(x < 0)
+        if eps <= eps_min:
+            break
+        eps = max(eps / 5, eps_min)
+    if not finite[np.arange(M), x].all():
+        return None
+    return x
+
+
+def scipy_kbest(C, unassigned=None):
+    """Generate assignments as murty, with scipy's assignment solver."""
+    return lap_kbest(C, unassigned, scipy_lap)
+
+
+def auction_kbest(C, unassigned=None):
+    """Generate assignments as murty, with the auction algorithm.
+
+    C must be square, without unassigned costs. The costs are optimal
+    within the tolerance of auction_lap, so near ties may be yielded out of
+    order.
+    """
+    if unassigned is not None or C.shape[0] != C.shape[1]:
+        raise ValueError("The auction only solves square problems "
+                         "without unassigned costs")
+    return lap_kbest(C, None, auction_lap)
+
+
+SOLVERS['scipy'] = scipy_kbest
+SOLVERS['auction'] = auction_kbest
+
+
+def calibrate(sizes=(2, 4, 8, 16, 32, 64), k=10, repeat=3, seed=0):
+    """Time the available solvers, and set THRESHOLDS from the timings.
+
+    The solvers draw k assignments of dense n x n problems, for the n in
+    sizes, with unassigned costs ('unassigned') and without ('square').
+    Every solver is timed at every size, on the problems it solves. Returns
+    the best time of repeat runs, as {kind: {size: {name: seconds}}}.
+    """
+    rng = np.random.RandomState(seed)
+    timings = {'unassigned': {}, 'square': {}}
+    for n in sizes:
+        C = rng.uniform(0, 10, (n, n))
+        for kind, unassigned in (('unassigned', np.full(n, 5.0)),
+                                 ('square', None)):
+            timings[kind][n * n] = times = {}
+            for name in available():
+                if name == 'auction' and unassigned is not None:
+                    continue
+                times[name] = float('inf')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    for _ in islice(SOLVERS[name](C, unassigned), k):
+                        pass
+                    times[name] = min(times[name],
+                                      time.perf_counter() - start)
+    THRESHOLDS.update(thresholds(timings))
+    return timings
+
+
+def thresholds(timings):
+    """Return the scipy and auction thresholds for calibrate timings.
+
+    scipy is used up to the largest size where it is fastest on problems
+    with unassigned costs for all smaller sizes, and auction from the
+    smallest size where it is fastest on square problems for all larger
+    sizes.
+    """
+    def fastest(timings):
+        """Get the (size, fastest solver) for each size."""
+        return [(size, min(times, key=times.get))
+                for size, times in sorted(timings.items())]
+
+    result = {'scipy': 0, 'auction': float('inf')}
+    for size, name in fastest(timings['unassigned']):
+        if name != 'scipy':
+            break
+        result['scipy'] = size
+    for size, name in reversed(fastest(timings['square'])):
+        if name != 'auction':
+            break
+        result['auction'] = size
+    return result
@@ -0,0 +1,104 @@
+"""In-process spatial index."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import defaultdict
+from math import floor
+
+from .utils import overlap
+
+
+class GridIndex:
+    """Uniform grid (spatial hash) over bounding boxes.
+
+    Each key is stored with one or more bounding boxes, and queries return
+    the keys having any box overlapping the query box. Boxes covering more
+    than max_cells cells are kept in a separate list that is always checked.
+    """
+
+    def __init__(self, cell_size=10.0, max_cells=256):
+        """Init."""
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.clear()
+
+    def clear(self):
+        """Remove all keys from index."""
+        self.cells = defaultdict(set)
+        self.boxes = {}
+        self.keycells = {}
+        self.large = set()
+
+    def _range(self, bbox):
+        """Return the cell index range covered by bbox."""
+        s = self.cell_size
+        return (floor(bbox[0] / s), floor(bbox[1] / s),
+                floor(bbox[2] / s), floor(bbox[3] / s))
+
+    def insert(self, key, bboxes):
+        """Insert or replace key with the given bounding boxes."""
+        self.remove(key)
+        bboxes = list(bboxes)
+        self.boxes[key] = bboxes
+        cells = set()
+        for bbox in bboxes:
+            i0, i1, j0, j1 = self._range(bbox)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > self.max_cells:
+                self.large.add(key)
+                cells = set()
+                break
+            cells.update((i, j) for i in range(i0, i1 + 1)
+                         for j in range(j0, j1 + 1))
+        for c in cells:
+            self.cells[c].add(key)
+        self.keycells[key] = cells
+
+    def remove(self, key):
+        """Remove key from index, if present."""
+        if key not in self.boxes:
+            return
+        for c in self.keycells.pop(key):
+            keys = self.cells[c]
+            keys.discard(key)
+            if not keys:
+                del self.cells[c]
+        self.large.discard(key)
+        del self.boxes[key]
+
+    def query(self, bbox):
+        """Return the keys having a bounding box overlapping bbox."""
+        i0, i1, j0, j1 = self._range(bbox)
+        candidates = set(self.large)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            for (i, j), keys in self.cells.items():
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    candidates |= keys
+        else:
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    keys = self.cells.get((i, j))
+                    if keys:
+                        candidates |= keys
+        return {k for k in candidates
+                if any(overlap(b, bbox) for b in self.boxes[k])}
+
+    def __len__(self):
+        """Return number of indexed keys."""
+        return len(self.boxes)
+
+    def __contains__(self, key):
+        """Check if key is indexed."""
+        return key in self.boxes
@@ -16,6 +16,7 @@
 """
 
 from .track import Track
+from .utils import bbox_union
 
 
 class Target:
@@ -58,10 +59,18 @@ class Target:
         """Move to next time step."""
         for track in self.tracks.values():
             track.predict(dT)
+        self._bbox = None
+
+    def bbox(self):
+        """Get minimal boundingbox of the target tracks, cached."""
+        if self._bbox is None:
+            self._bbox = bbox_union(tr.bbox() for tr in self.tracks.values())
+        return self._bbox
 
     def reset(self):
         """Reset caches etc."""
         self.new_tracks = {}
+        self._bbox = None
 
     def __repr__(self):
         """String representation of object."""
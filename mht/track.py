@@ -17,7 +17,9 @@
 
 from copy import deepcopy
 from math import exp, log
+import numpy as np
 
+from .kf import nll_matrix
 from .utils import LARGE, overlap, overlap_pa
 
 NEW_EXIST_SCORE = 1
@@ -41,6 +43,8 @@ class Track:
         self._trid = self.__class__._counter
         self._id = target._id
         self.__class__._counter += 1
+        self.history = ((parent._trid, parent.report_id()),) \
+            + parent.history if parent else ()
 
         self.sources = deepcopy(parent.sources) if parent else set()
         if report:
@@ -67,8 +71,12 @@ class Track:
     @staticmethod
     def extend(parent, report, sensor):
         """Create child track."""
-        filt = parent.target.cluster.params.init_target_tracker(report, parent)
-        score = filt.correct(report)
+        cluster = parent.target.cluster
+        filt = cluster.params.init_target_tracker(report, parent)
+        table = getattr(cluster, 'score_table', None)
+        innovation = table.innovation(parent, report, filt) \
+            if table is not None else None
+        score = filt.correct(report, innovation)
         self = Track(parent.target, parent, filt, report)
         self.my_score = score - sensor.score_found
         self.exist_score = min(parent.exist_score + 1, MAX_EXIST_SCORE)
@@ -97,6 +105,21 @@ class Track:
             self.children[report] = self.target.new_tracks[report]
         return self.children[report]
 
+    def ancestor(self, n):
+        """Return the (trid, report id) of the track n scans back.
+
+        history holds the (trid, report id) of the ancestors, newest first, and
+        is cut by the cluster after each scan. Returns None if the history
+        is shorter than n scans.
+        """
+        if n == 0:
+            return (self._trid, self.report_id())
+        return self.history[n - 1] if len(self.history) >= n else None
+
+    def report_id(self):
+        """Return the id of the report of the track, or None."""
+        return self.report._id if self.report else None
+
     def is_new(self):
         """Return true if target is new."""
         return (self.parent_id is None)
@@ -117,6 +140,32 @@ class Track:
             return LARGE
         return LARGE
 
+    @staticmethod
+    def match_scores(tracks, reports, sensor, innovations=None):
+        """Find the scores of assigning each report to each track.
+
+        Returns a len(tracks) x len(reports) array, equal to match_score for
+        each pair, with the filter nll scores computed in batch. Batching
+        does not pay off for a couple of pairs, which are scored directly.
+        innovations is passed on to kf.nll_matrix.
+        """
+        if len(tracks) * len(reports) <= 2:
+            return np.array([[tr.match_score(r, sensor) for r in reports]
+                             for tr in tracks]).reshape(len(tracks),
+                                                        len(reports))
+        scores = np.full((len(tracks), len(reports)), float(LARGE))
+        sbbox = sensor.bbox()
+        visible = [i for i, tr in enumerate(tracks)
+                   if overlap(tr.bbox(), sbbox)]
+        if visible and reports:
+            offset = np.array([tracks[i].found_score(sensor)
+                               - tracks[i].miss_score(sensor)
+                               for i in visible])
+            scores[visible] = nll_matrix(
+                [tracks[i].filter for i in visible], reports, innovations) \
+                + offset[:, None]
+        return scores
+
     def found_score(self, sensor):
         """Find the score of assigning any report to the track."""
         score_miss = self.miss_score(sensor)
@@ -63,6 +63,43 @@ def overlap(a, b):
             a[3] >= b[2] and a[2] <= b[3])
 
 
+def bbox_union(bboxes):
+    """Return the minimal bbox covering all bboxes."""
+    bboxes = iter(bboxes)
+    minbox = next(bboxes)
+    for bbox in bboxes:
+        minbox = (min(minbox[0], bbox[0]),
+                  max(minbox[1], bbox[1]),
+                  min(minbox[2], bbox[2]),
+                  max(minbox[3], bbox[3]))
+    return minbox
+
+
+def overlap_pairs(a, b, chunk=256):
+    """Return index arrays (i, j) of all overlapping bboxes a[i] and b[j].
+
+    Sort-and-sweep along x: b is sorted on min_x and a on max_x, so that each
+    chunk of a is only broadcast against the prefix of b it can overlap.
+    """
+    a = np.asarray(a, dtype=float).reshape(-1, 4)
+    b = np.asarray(b, dtype=float).reshape(-1, 4)
+    if len(a) == 0 or len(b) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    aorder = np.argsort(a[:, 1], kind='stable')
+    border = np.argsort(b[:, 0], kind='stable')
+    a = a[aorder]
+    b = b[border]
+    ii, jj = [], []
+    for s in range(0, len(a), chunk):
+        ac = a[s:s + chunk, :, None]
+        bc = b[:np.searchsorted(b[:, 0], ac[-1, 1, 0], side='right')].T
+        i, j = np.nonzero((ac[:, 1] >= bc[0]) & (ac[:, 0] <= bc[1]) &
+                          (ac[:, 3] >= bc[2]) & (ac[:, 2] <= bc[3]))
+        ii.append(aorder[i + s])
+        jj.append(border[j])
+    return np.concatenate(ii), np.concatenate(jj)
+
+
 def overlap_pa(a, b):
     """Return percentage of bbox a being in b."""
     intersection = max(0, min(a[1], b[1]) - max(a[0], b[0])) \
@@ -2,174 +2,395 @@
 #pragma once
 
 #include <Eigen/Core>
+#include <algorithm>
+#include <functional>
+#include <limits>
+#include <queue>
+#include <utility>
+#include <vector>
 
 namespace lap {
 
 using Assignment = Eigen::Matrix<int, Eigen::Dynamic, 1>;
 using Slack = Eigen::Matrix<double, Eigen::Dynamic, 1>;
-static const int inf = 300000;
 
-template<typename CostMatrix, typename Assignment, typename RowSlack, typename ColSlack>  // NOLINT
-void lap(const CostMatrix& C, Assignment& x, RowSlack& u, ColSlack& v) {
-    int N = C.rows();
-    int M = C.cols();
-    int cnt, H, f, f0, i, i1, j, j1, j2 = 0, k, last = 0, low, min = 0, up;
-    double h, u1, u2;
-    Eigen::RowVectorXi free(N), col(M), y(M), pred(M);
-    Eigen::RowVectorXd d(M);
 
-    x.setConstant(-1);
-    y.setConstant(-1);
-    v.setZero();
-    u.setZero();
-
-    for (i = 0; i < N; ++i) { free[i] = i; }
-    for (j = 0; j < M; ++j) { col[j] = j; }
-
-    f = N;  // Each row is still unassigned
-
-    for (cnt = 0; cnt < 2; ++cnt) {
-        k = 0;
-        f0 = f;
-        f = 0;
-        while (k < f0) {
-            i = free[k++];
-            u1 = C(i, 0) - v[0];
-            j1 = 0;
-            u2 = inf;
-            for (j = 1; j < M; ++j) {
-                h = C(i, j) - v[j];
-                if (h < u2) {
-                    if (h >= u1) {
-                        u2 = h;
-                        j2 = j;
-                    } else {
-                        u2 = u1;
-                        u1 = h;
-                        j2 = j1;
-                        j1 = j;
+template<typename SparseMatrix, typename Unassigned>
+struct SparseView {
+    // The stored entries of a row major sparse cost matrix, where entries not
+    // stored are forbidden. If unassigned costs are given, row i may be left
+    // unassigned at cost unassigned[i], represented by the virtual column
+    // cols + i. Views provide active(i), and entries(i, f) calling f(j, cost)
+    // for each allowed column of row i.
+    const SparseMatrix& C;
+    const Unassigned& e;
+
+    SparseView(const SparseMatrix& C_, const Unassigned& e_) : C(C_), e(e_) {}
+
+    int rows() const { return C.rows(); }
+    int cols() const { return C.cols() + e.size(); }
+    bool active(const int) const { return true; }
+
+    template<typename F>
+    void entries(const int i, F f) const {
+        for (typename SparseMatrix::InnerIterator it(C, i); it; ++it) {
+            f(it.col(), it.value());
+        }
+        if (e.size() > 0 && e[i] < std::numeric_limits<double>::infinity()) {
+            f(C.cols() + i, e[i]);
+        }
+    }
+};
+
+
+template<typename Costs, typename Assignment, typename RowSlack, typename ColSlack>  // NOLINT
+class Augmenter {
+    // Shortest augmenting path search over the allowed entries of a cost
+    // view. Work arrays are kept between searches, and only the touched
+    // columns are reset.
+ public:
+    Augmenter(const Costs& C_, Assignment& x_, Assignment& y_, RowSlack& u_, ColSlack& v_)  // NOLINT
+    : C(C_), x(x_), y(y_), u(u_), v(v_),
+      d(C_.cols()), pred(C_.cols()), done(C_.cols()) {
+        d.setConstant(std::numeric_limits<double>::infinity());
+        done.setZero();
+    }
+
+    bool operator()(const int i0) {
+        using Item = std::pair<double, int>;
+        std::priority_queue<Item, std::vector<Item>, std::greater<Item>> heap;
+        int sink = -1;
+        double D = 0;
+
+        auto relax = [&](const int i, const double base) {
+            C.entries(i, [&](const int j, const double c) {
+                double h = base + c - u[i] - v[j];
+                if (!done[j] && h < d[j]) {
+                    if (d[j] == std::numeric_limits<double>::infinity()) {
+                        touched.push_back(j);
                     }
+                    d[j] = h;
+                    pred[j] = i;
+                    heap.emplace(h, j);
                 }
+            });
+        };
+
+        relax(i0, 0);
+        while (!heap.empty()) {
+            auto [h, j] = heap.top();
+            heap.pop();
+            if (done[j] || h > d[j]) {
+                continue;
             }
-            i1 = y[j1];
-            if (u1 < u2) {
-                v[j1] = v[j1] - u2 + u1;
-            } else if (i1 >= 0) {
-                j1 = j2;
-                i1 = y[j1];
+            done[j] = 1;
+            if (y[j] < 0) {
+                sink = j;
+                D = h;
+                break;
             }
-            if (i1 >= 0) {
-                if (u1 < u2) {
-                    free[--k] = i1;
-                    x[i1] = -1;
-                } else {
-                    free[f++] = i1;
-                    x[i1] = -1;
-                }
+            finished.push_back(j);
+            relax(y[j], h);
+        }
+
+        if (sink >= 0) {
+            // Update duals of the finished columns and their rows
+            for (int j : finished) {
+                u[y[j]] += D - d[j];
+                v[j] -= D - d[j];
             }
-            x[i] = j1;
-            y[j1] = i;
-        }
-    }
-
-    // --------------------------------------------------------
-    // Augmentation:
-    //
-
-    f0 = f;
-    for (f = 0; f < f0; ++f) {  // Find augmenting path for each unassigned row
-        i1 = free[f];
-        low = 0;
-        up = 0;
-        for (j = 0; j < M; ++j) {
-            d[j] = C(i1, j) - v[j];
-            pred[j] = i1;
-        }
-        while (true) {
-            if (up == low) {  // Find columns with new value for minimum d
-                last = low - 1;
-                min = d[col[up]];
-                up = up + 1;
-                for (k = up; k < M; ++k) {
-                    j = col[k];
-                    h = d[j];
-                    if (h <= min) {
-                        if (h < min) {
-                            up = low;
-                            min = h;
-                        }
-                        col[k] = col[up];
-                        col[up] = j;
-                        up = up + 1;
-                    }
-                }
-                for (H = low; H < up; ++H) {
-                    j = col[H];
-                    if (y[j] == -1) {
-                        goto augment;
-                    }
+            u[i0] += D;
+
+            // Augment along path
+            int i, j = sink, k;
+            do {
+                i = pred[j];
+                y[j] = i;
+                k = x[i];
+                x[i] = j;
+                j = k;
+            } while (i != i0);
+        }
+
+        for (int j : touched) {
+            d[j] = std::numeric_limits<double>::infinity();
+            done[j] = 0;
+        }
+        touched.clear();
+        finished.clear();
+        return sink >= 0;
+    }
+
+ private:
+    const Costs& C;
+    Assignment& x;
+    Assignment& y;
+    RowSlack& u;
+    ColSlack& v;
+    Eigen::VectorXd d;
+    Eigen::VectorXi pred;
+    Eigen::Matrix<char, Eigen::Dynamic, 1> done;
+    std::vector<int> touched, finished;
+};
+
+
+template<typename Costs, typename Assignment, typename RowSlack, typename ColSlack>  // NOLINT
+bool sap(const Costs& C, Assignment& x, RowSlack& u, ColSlack& v) {
+    // Solve the rectangular assignment problem of the active rows of a cost
+    // view, by successive shortest augmenting paths. Work scales with the
+    // number of allowed entries. Inactive rows are left at -1. Returns false
+    // if no complete assignment of the active rows exists.
+    Assignment y(C.cols());
+
+    x.setConstant(-1);
+    y.setConstant(-1);
+    v.setZero();
+
+    // Row minima give feasible initial row duals, also for negative costs
+    for (int i = 0; i < C.rows(); ++i) {
+        u[i] = std::numeric_limits<double>::infinity();
+        if (C.active(i)) {
+            C.entries(i, [&](const int, const double c) {
+                u[i] = std::min(u[i], c);
+            });
+        }
+    }
+
+    Augmenter<Costs, Assignment, RowSlack, ColSlack> augment(C, x, y, u, v);
+    for (int i = 0; i < C.rows(); ++i) {
+        if (C.active(i) && !augment(i)) {
+            return false;
+        }
+    }
+    return true;
+}
+
+
+template<typename Costs, typename Assignment, typename RowSlack, typename ColSlack>  // NOLINT
+bool reassign(const Costs& C, Assignment& x, RowSlack& u, ColSlack& v, double& uh, const int i0, const int loose) {  // NOLINT
+    // Re-solve an optimal assignment, with duals u, v and uh, after row i0
+    // has been freed and its assignment forbidden, by a single augmenting
+    // path. Unassigned columns are held by a hub with dual uh, such that
+    // v[j] <= -uh with equality for the unassigned columns. The column
+    // loose, if not negative, was freed with i0 and ends the path, possibly
+    // through the hub. Otherwise the hub gives up one of its columns. The
+    // view must also provide column(j), telling whether column j is part of
+    // the problem. Returns false if no complete assignment exists.
+    const int H = C.cols();
+    const double inf = std::numeric_limits<double>::infinity();
+    Assignment y(C.cols());
+    y.setConstant(-1);
+    for (int i = 0; i < C.rows(); ++i) {
+        if (C.active(i) && x[i] >= 0) {
+            y[x[i]] = i;
+        }
+    }
+
+    using Item = std::pair<double, int>;
+    std::priority_queue<Item, std::vector<Item>, std::greater<Item>> heap;
+    Eigen::VectorXd d(C.cols() + 1);
+    Eigen::VectorXi pred(C.cols() + 1);
+    std::vector<char> done(C.cols() + 1, 0);
+    std::vector<int> finished;
+    d.setConstant(inf);
+
+    auto relax_to = [&](const int j, const double h, const int p) {
+        if (!done[j] && h < d[j]) {
+            d[j] = h;
+            pred[j] = p;
+            heap.emplace(h, j);
+        }
+    };
+    auto relax = [&](const int i, const double base) {
+        C.entries(i, [&](const int j, const double c) {
+            relax_to(j, base + c - u[i] - v[j], i);
+        });
+    };
+
+    int sink = -1;
+    double D = 0;
+    relax(i0, 0);
+    while (!heap.empty()) {
+        auto [h, j] = heap.top();
+        heap.pop();
+        if (done[j] || h > d[j] || (j != loose && j != H && y[j] < 0 && done[H])) {  // NOLINT
+            continue;
+        }
+        done[j] = 1;
+        if (j == H) {
+            // Only the loose column, and the assigned columns with higher
+            // duals, can be reached through the hub before the loose one.
+            // The hub's own columns are all at distance h, and are not
+            // searched further.
+            finished.push_back(H);
+            relax_to(loose, h - uh - v[loose], H);
+            for (int k = 0; k < C.cols(); ++k) {
+                if (y[k] >= 0 && v[k] > v[loose] && C.column(k)) {
+                    relax_to(k, h - uh - v[k], H);
                 }
-            }  //{ up=low }
-            j1 = col[low];
-            low = low + 1;
-            i = y[j1];
-            u1 = C(i, j1) - v[j1] - min;
-            for (k = up; k < M; ++k) {
-                j = col[k];
-                h = C(i, j) - v[j] - u1;
-                if (h < d[j]) {
-                    d[j] = h;
-                    pred[j] = i;
-                    if (h == min) {
-                        if (y[j] == -1) {
-                            goto augment;
-                        } else {
-                            col[k] = col[up];
-                            col[up] = j;
-                            up = up + 1;
-                        }
-                    }
+            }
+            continue;
+        }
+        if (j == loose || (loose < 0 && y[j] < 0)) {
+            sink = j;
+            D = h;
+            break;
+        }
+        finished.push_back(j);
+        if (y[j] >= 0) {
+            relax(y[j], h);
+        } else {
+            relax_to(H, h, j);
+        }
+    }
+    if (sink < 0) {
+        return false;
+    }
+
+    // Update duals of the finished columns, their rows and the hub
+    for (int j : finished) {
+        if (j == H) {
+            // The hub's columns stay tight. Columns no longer in the problem
+            // are not used again, and are updated alike.
+            uh += D - d[H];
+            for (int k = 0; D > d[H] && k < C.cols(); ++k) {
+                if (y[k] < 0 && k != loose && !done[k]) {
+                    v[k] -= D - d[H];
                 }
-            }  // for k
+            }
+        } else {
+            v[j] -= D - d[j];
+            if (y[j] >= 0) {
+                u[y[j]] += D - d[j];
+            }
+        }
+    }
+    u[i0] += D;
+
+    // Augment along path. A column reached from the hub is handed to the
+    // hub, which releases the column it was reached through.
+    for (int j = sink;;) {
+        int i = pred[j];
+        if (i == H) {
+            y[j] = -1;
+            j = pred[H];
+            continue;
+        }
+        y[j] = i;
+        int k = x[i];
+        x[i] = j;
+        if (i == i0) {
+            break;
+        }
+        j = k;
+    }
+    return true;
+}
+
+
+template<typename Costs, typename Assignment, typename RowSlack, typename ColSlack>  // NOLINT
+bool resume(const Costs& C, Assignment& x, RowSlack& u, ColSlack& v, double& uh) {  // NOLINT
+    // Solve the assignment problem of the active rows of a cost view, from
+    // the assignment x (-1 for free rows) and column duals v of a related
+    // problem. The hint is repaired into a feasible partial solution: row
+    // duals are set to the lowest reduced cost of each row, rows whose hinted
+    // assignment is not among their lowest are freed, and the unassigned
+    // columns are lowered to a common hub dual -uh (see reassign), freeing
+    // the rows of columns above it. The free rows are then augmented one
+    // path at a time. Returns false if no complete
+    // assignment exists.
+    const double inf = std::numeric_limits<double>::infinity();
+    Assignment y(C.cols());
+    y.setConstant(-1);
+    for (int i = 0; i < C.rows(); ++i) {
+        if (!C.active(i)) {
+            x[i] = -1;
+            continue;
+        }
+        bool allowed = false;
+        if (x[i] >= 0 && x[i] < C.cols() && y[x[i]] < 0) {
+            C.entries(i, [&](const int j, const double) {
+                allowed = allowed || j == x[i];
+            });
         }
+        if (allowed) {
+            y[x[i]] = i;
+        } else {
+            x[i] = -1;
+        }
+    }
 
-        augment:
-        for (k = 0; k < last; ++k) {  // Updating of column prices
-            j1 = col[k];
-            v[j1] = v[j1] + d[j1] - min;
+    for (int i = 0; i < C.rows(); ++i) {
+        if (!C.active(i)) {
+            continue;
+        }
+        u[i] = inf;
+        C.entries(i, [&](const int j, const double c) {
+            u[i] = std::min(u[i], c - v[j]);
+        });
+        if (u[i] == inf) {
+            return false;
         }
-        do {  // Augmentation
-            i = pred[j];
-            y[j] = i;
-            k = j;
-            j = x[i];
-            x[i] = k;
-        } while (i != i1);
-    }  // { for f }
+        if (x[i] >= 0) {
+            bool tight = false;
+            C.entries(i, [&](const int j, const double c) {
+                tight = tight || (j == x[i] && c - v[j] == u[i]);
+            });
+            if (!tight) {
+                y[x[i]] = -1;
+                x[i] = -1;
+            }
+        }
+    }
 
-    for (i = 0; i < N; ++i) {
-        j = x[i];
-        u[i] = C(i, j) - v[j];
+    // Lowering column duals keeps the row duals feasible
+    double m = inf, vmax = -inf;
+    for (int j = 0; j < C.cols(); ++j) {
+        if (C.column(j)) {
+            vmax = std::max(vmax, static_cast<double>(v[j]));
+            if (y[j] < 0) {
+                m = std::min(m, static_cast<double>(v[j]));
+            }
+        }
+    }
+    if (m == inf) {
+        m = vmax;
+    }
+    uh = -m;
+    for (int j = 0; j < C.cols(); ++j) {
+        if (y[j] >= 0 && v[j] > m) {
+            x[y[j]] = -1;
+            y[j] = -1;
+        }
+        if (y[j] < 0) {
+            v[j] = std::min(static_cast<double>(v[j]), m);
+        }
     }
+
+    for (int i = 0; i < C.rows(); ++i) {
+        if (C.active(i) && x[i] < 0 && !reassign(C, x, u, v, uh, i, -1)) {
+            return false;
+        }
+    }
+    return true;
 }
 
 
-template<typename CostMatrix>
-Assignment lap(const CostMatrix& C) {
-    Slack u(C.rows());
-    Slack v(C.cols());
-    Assignment x(C.rows());
-    lap(C, x, u, v);
-    return x;
+template<typename SparseMatrix, typename Unassigned, typename Assignment, typename RowSlack, typename ColSlack>  // NOLINT
+bool sparse_lap(const SparseMatrix& C, const Unassigned& e, Assignment& x, RowSlack& u, ColSlack& v) {  // NOLINT
+    // Solve the rectangular assignment problem over the stored entries of a
+    // row major sparse matrix. Each row i may also be left unassigned at cost
+    // e[i] (if e is not empty), which is reported as the virtual column
+    // cols + i, and v holds the duals of the virtual columns after those of
+    // the real ones. Returns false if no complete assignment exists.
+    return sap(SparseView<SparseMatrix, Unassigned>(C, e), x, u, v);
 }
 
-template<typename CostMatrix>
-inline double cost(CostMatrix& C, Assignment res) {
-    double c = 0;
-    for (unsigned i = 0; i < res.rows(); ++i) {
-        c += C(i, res[i]);
-    }
-    return c;
+
+template<typename SparseMatrix, typename Assignment, typename RowSlack, typename ColSlack>  // NOLINT
+bool sparse_lap(const SparseMatrix& C, Assignment& x, RowSlack& u, ColSlack& v) {
+    Slack e(0);
+    return sparse_lap(C, e, x, u, v);
 }
 
 }  // namespace lap
@@ -1,13 +1,75 @@
 #include <pybind11/eigen.h>
+#include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 #include <Eigen/Core>
+#include <limits>
+#include <vector>
 #include "murty.hpp"
 
 namespace py = pybind11;
 
+// Row major float64 arrays are passed without a conversion copy, and are
+// copied once, into the sparse base problem
+using DenseCosts = Eigen::Ref<const Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>>;  // NOLINT
+
+py::tuple draw_k(lap::Murty& m, const unsigned k, const double max_cost) {
+    std::vector<double> costs;
+    std::vector<int> solutions;
+    unsigned n;
+    {
+        py::gil_scoped_release release;
+        n = m.draw_k(k, max_cost, costs, solutions);
+    }
+    py::array_t<double> c(n);
+    py::array_t<int> s({static_cast<py::ssize_t>(n), static_cast<py::ssize_t>(m.rows())});  // NOLINT
+    std::copy(costs.begin(), costs.end(), c.mutable_data());
+    std::copy(solutions.begin(), solutions.end(), s.mutable_data());
+    return py::make_tuple(c, s);
+}
+
+py::object first_solution(const lap::Murty& m) {
+    auto lp = m.first_solution();
+    if (!lp) {
+        return py::none();
+    }
+    lap::Assignment x = lp->x;
+    for (int i = 0; i < x.size(); ++i) {
+        if (x[i] >= static_cast<int>(m.cols())) {
+            x[i] = -1;
+        }
+    }
+    return py::make_tuple(x, lp->u, lp->v);
+}
+
 PYBIND11_MODULE(murty, m) {
     py::class_<lap::Murty>(m, "Murty")
-        .def(py::init<lap::CostMatrix>())
-        .def("draw", &lap::Murty::draw_tuple);
+        .def(py::init([](const DenseCosts& C) {
+            return new lap::Murty(lap::sparse(C));
+        }))
+        .def(py::init<lap::SparseCostMatrix>())
+        .def(py::init([](const DenseCosts& C, lap::Slack unassigned) {
+            return new lap::Murty(lap::sparse(C), std::move(unassigned));
+        }))
+        .def(py::init<lap::SparseCostMatrix, lap::Slack>())
+        .def_readwrite("msc", &lap::Murty::msc,
+                       "Re-solve partitions from their parent solutions "
+                       "(Miller, Stone & Cox), instead of from scratch.")
+        .def("seed", &lap::Murty::seed,
+             "Seed the first solution with the assignment x (-1 unassigned, "
+             "-2 no hint) and column duals v of a related solved problem. v "
+             "holds the duals of the unassigned columns of each row after "
+             "those of the real columns.",
+             py::arg("x"), py::arg("v"))
+        .def("first_solution", &first_solution,
+             "The (x, u, v) assignment and duals of the first solution, or "
+             "None if not drawn.")
+        .def("draw", &lap::Murty::draw_tuple,
+             py::call_guard<py::gil_scoped_release>())
+        .def("draw_k", &draw_k,
+             "Draw up to k solutions costing at most max_cost, as an array "
+             "of costs and a k x rows array of assignments. The GIL is "
+             "released while solving.",
+             py::arg("k"),
+             py::arg("max_cost") = std::numeric_limits<double>::infinity());
 }
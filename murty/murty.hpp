@@ -5,15 +5,18 @@
 #include <algorithm>
 #include <exception>
 #include <iostream>
+#include <limits>
 #include <memory>
+#include <numeric>
 #include <queue>
-#include <set>
+#include <stdexcept>
 #include <tuple>
 #include <vector>
 #include "lap.hpp"
 
 namespace lap {
 using CostMatrix = Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic>;
+using SparseCostMatrix = Eigen::SparseMatrix<double, Eigen::RowMajor, int>;
 
 class EmptyQueue: public std::exception {
  public:
@@ -22,165 +25,231 @@ class EmptyQueue: public std::exception {
     }
 };
 
-void allbut(const Eigen::MatrixXd& from, Eigen::MatrixXd& to, const unsigned row, const unsigned col) {
-    unsigned rows = from.rows();
-    unsigned cols = from.cols();
-
-    to.resize(rows - 1, cols - 1);
-
-    if (row > 0 && col > 0) {
-        to.block(0, 0, row, col) = from.block(0, 0, row, col);
-    }
-    if (row > 0 && col < cols - 1) {
-        to.block(0, col, row, cols - col - 1) =
-            from.block(0, col + 1, row, cols - col - 1);
-    }
-    if (row < rows - 1 && col > 0) {
-        to.block(row, 0, rows - row - 1, col) =
-            from.block(row + 1, 0, rows - row - 1, col);
-    }
-    if (row < rows - 1 && col < cols - 1) {
-        to.block(row, col, rows - row - 1, cols - col - 1) =
-            from.block(row + 1, col + 1, rows - row - 1, cols - col - 1);
+template<typename Derived>
+SparseCostMatrix sparse(const Eigen::MatrixBase<Derived>& C) {
+    // All entries of a dense matrix, zeros included. The values are copied
+    // from C in one pass, straight into the compressed storage.
+    const int rows = C.rows(), cols = C.cols();
+    SparseCostMatrix S(rows, cols);
+    S.resizeNonZeros(rows * cols);
+    Eigen::Map<Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic,
+                             Eigen::RowMajor>>(S.valuePtr(), rows, cols) = C;
+    for (int i = 0; i < rows; ++i) {
+        S.outerIndexPtr()[i] = i * cols;
+        std::iota(S.innerIndexPtr() + i * cols,
+                  S.innerIndexPtr() + (i + 1) * cols, 0);
     }
+    S.outerIndexPtr()[rows] = rows * cols;
+    return S;
 }
 
-void allbut(const Eigen::Matrix<double, Eigen::Dynamic, 1>& from, Eigen::Matrix<double, Eigen::Dynamic, 1>& to, const unsigned row) {
-    unsigned rows = from.rows();
 
-    to.resize(rows - 1, 1);
+struct MurtyCosts {
+    // The base problem, shared between all states of a Murty instance. Row i
+    // may be left unassigned at cost unassigned[i], if given, represented by
+    // the virtual column cols() + i.
+    SparseCostMatrix C;
+    Slack unassigned;
 
-    if (row > 0) {
-        to.block(0, 0, row, 1) = from.block(0, 0, row, 1);
+    MurtyCosts(SparseCostMatrix C_, Slack unassigned_)
+    : C(std::move(C_)), unassigned(std::move(unassigned_)) {
+        C.makeCompressed();
     }
-    if (row < rows - 1) {
-        to.block(row, 0, rows - row - 1, 1) =
-            from.block(row + 1, 0, rows - row - 1, 1);
-    }
-}
 
-void allbut(const Eigen::Matrix<double, 1, Eigen::Dynamic>& from, Eigen::Matrix<double, 1, Eigen::Dynamic>& to, const unsigned col) {
-    unsigned cols = from.cols();
+    int rows() const { return C.rows(); }
+    int cols() const { return C.cols(); }
 
-    to.resize(1, cols - 1);
-
-    if (col > 0) {
-        to.block(0, 0, 1, col) = from.block(0, 0, 1, col);
+    double coeff(const int i, const int j) const {
+        return j < cols() ? C.coeff(i, j) : unassigned[i];
     }
-    if (col < cols - 1) {
-        to.block(0, col, 1, cols - col - 1) =
-            from.block(0, col + 1, 1, cols - col - 1);
+
+    int entry(const int i, const int j) const {
+        // Index of the stored entry (i, j), or -1 - i for the virtual column
+        if (j >= cols()) {
+            return -1 - i;
+        }
+        const int* begin = C.innerIndexPtr() + C.outerIndexPtr()[i];
+        const int* end = C.innerIndexPtr() + C.outerIndexPtr()[i + 1];
+        return std::lower_bound(begin, end, j) - C.innerIndexPtr();
     }
-}
+};
+
+
+struct MurtySolution {
+    // Optimal assignment and duals of a solved state, with the dual uh of
+    // the unassigned columns (see lap::reassign). Shared with the partitions
+    // of the state, which are re-solved from it.
+    Assignment x;
+    Slack u, v;
+    double uh;
+};
 
 
 struct MurtyState {
+    // A partition of the base problem: the rows and columns bound by the
+    // partition are masked out, and its forbidden entries are kept as a
+    // sorted list of entry indices. States are views for lap::sap.
     using Slacklist = std::vector<std::tuple<double, unsigned, unsigned>>;
-    Eigen::MatrixXd C;
-    Slack u, v;
+    std::shared_ptr<const MurtyCosts> costs;
+    std::vector<bool> row_bound, col_bound;
+    std::vector<int> forbidden;
+    unsigned nfree;
     double cost;
     double boundcost;
     bool solved;
     Assignment solution;
-    Assignment res;
-    std::vector<unsigned> rmap, cmap;
+    std::shared_ptr<MurtySolution> lp;
+    std::shared_ptr<const MurtySolution> warm;
+    int freed;
 
     explicit MurtyState(const MurtyState* s)
-    :
+    : costs(s->costs),
+      row_bound(s->row_bound),
+      col_bound(s->col_bound),
+      forbidden(s->forbidden),
+      nfree(s->nfree),
       cost(s->cost),
       boundcost(s->boundcost),
       solved(false),
       solution(s->solution),
-      rmap(s->rmap),
-      cmap(s->cmap) {}
-
-    explicit MurtyState(const Eigen::MatrixXd& C_)
-    : C(C_),
-      u(C_.rows()),
-      v(C_.cols()),
+      warm(s->lp ? s->lp : s->warm),
+      freed(-1) {}
+
+    explicit MurtyState(std::shared_ptr<const MurtyCosts> costs_)
+    : costs(costs_),
+      row_bound(costs_->rows(), false),
+      col_bound(costs_->cols(), false),
+      nfree(costs_->rows()),
       cost(0),
       boundcost(0),
       solved(false),
-      solution(C_.rows()) {
-        v.setZero();
-        rmap.resize(C.rows());
-        cmap.resize(C.cols());
-        for (unsigned i = 0; i < C.rows(); ++i) { rmap[i] = i; }
-        for (unsigned j = 0; j < C.cols(); ++j) { cmap[j] = j; }
+      solution(costs_->rows()),
+      freed(-1) {}
+
+    int rows() const { return costs->rows(); }
+    int cols() const { return costs->cols() + costs->unassigned.size(); }
+    bool active(const int i) const { return !row_bound[i]; }
+
+    bool column(const int j) const {
+        if (j < costs->cols()) {
+            return !col_bound[j];
+        }
+        const int i = j - costs->cols();
+        return active(i)
+            && costs->unassigned[i] < std::numeric_limits<double>::infinity()
+            && !is_forbidden(-1 - i);
     }
 
-    auto partition_with(const unsigned i, const unsigned j) {
-        auto s = std::make_shared<MurtyState>(this);
+    bool is_forbidden(const int k) const {
+        return !forbidden.empty()
+            && std::binary_search(forbidden.begin(), forbidden.end(), k);
+    }
 
-        allbut(C, s->C, i, j);
-        allbut(u, s->u, i);
-        allbut(v, s->v, j);
-        //std::cout << "            Binding (" << rmap[i] << "," << cmap[j] << ") (" << C(i, j) << ") [" << s->C.rows() << "x" << s->C.cols() << "]" << std::endl;
-        s->rmap.erase(s->rmap.begin() + i);
-        s->cmap.erase(s->cmap.begin() + j);
-        s->boundcost += C(i, j);
+    template<typename F>
+    void entries(const int i, F f) const {
+        const SparseCostMatrix& C = costs->C;
+        const int* inner = C.innerIndexPtr();
+        const double* value = C.valuePtr();
+        for (int k = C.outerIndexPtr()[i]; k < C.outerIndexPtr()[i + 1]; ++k) {
+            if (!col_bound[inner[k]] && !is_forbidden(k)) {
+                f(inner[k], value[k]);
+            }
+        }
+        const Slack& e = costs->unassigned;
+        if (e.size() > 0 && e[i] < std::numeric_limits<double>::infinity()
+                && !is_forbidden(-1 - i)) {
+            f(costs->cols() + i, e[i]);
+        }
+    }
 
-        return s;
+    void bind(const unsigned i, const unsigned j) {
+        //std::cout << "            Binding (" << i << "," << j << ") (" << costs->coeff(i, j) << ")" << std::endl;
+        row_bound[i] = true;
+        if (static_cast<int>(j) < costs->cols()) {
+            col_bound[j] = true;
+        }
+        --nfree;
+        boundcost += costs->coeff(i, j);
     }
 
     auto partition_without(const unsigned i, const unsigned j, const double slack) {
         auto s = std::make_shared<MurtyState>(this);
-        s->C = C;
-        s->u = u;
-        s->v = v;
         s->remove(i, j, slack);
 
         return s;
     }
 
     void remove(const unsigned i, const unsigned j, const double slack) {
-        //std::cout << "            Removing (" << rmap[i] << "," << cmap[j] << ") (" << C(i, j) << ") [" << C.rows() << "x" << C.cols() << "] raising cost " << cost << " -> ";
-        C(i, j) = lap::inf;
+        //std::cout << "            Removing (" << i << "," << j << ") (" << costs->coeff(i, j) << ") raising cost " << cost << " -> ";
+        int k = costs->entry(i, j);
+        forbidden.insert(std::lower_bound(forbidden.begin(), forbidden.end(), k), k);  // NOLINT
+        freed = i;
         solved = false;
         cost += slack;
         //std::cout << cost << std::endl;
-        //std::cout << "New C: " << std::endl << C << std::endl;
     }
 
-    bool solve() {
-        //std::cout << "Solving (" << cost << "): " << std::endl << C << std::endl;
-        res.resize(C.rows());
-        lap::lap(C, res, u, v);
-        //std::cout << "rmap: ";
-        //for (auto& r : rmap) {
-            //std::cout << r << ", ";
-        //}
-        //std::cout << std::endl;
-        //std::cout << "cmap: ";
-        //for (auto& c : cmap) {
-            //std::cout << c << ", ";
-        //}
-        //std::cout << std::endl;
+    bool solve(const bool msc) {
+        // With msc, a partition is re-solved from the solution of the state
+        // it was partitioned from (Miller, Stone & Cox), by one augmenting
+        // path from the freed row. A seeded root state is solved from its
+        // seed. Otherwise states are solved from scratch.
+        solved = true;
+        lp = std::make_shared<MurtySolution>();
+        if (msc && warm && freed >= 0) {
+            *lp = *warm;
+            const int j = lp->x[freed];
+            lp->x[freed] = -1;
+            if (!lap::reassign(*this, lp->x, lp->u, lp->v, lp->uh, freed,
+                               j < costs->cols() ? j : -1)) {
+                return false;
+            }
+        } else if (warm && freed < 0) {
+            *lp = *warm;
+            lp->u.resize(rows());
+            if (!lap::resume(*this, lp->x, lp->u, lp->v, lp->uh)) {
+                return false;
+            }
+        } else {
+            lp->x.resize(rows());
+            lp->u.resize(rows());
+            lp->v.resize(cols());
+            lp->uh = 0;
+            if (!lap::sap(*this, lp->x, lp->u, lp->v)) {
+                return false;
+            }
+        }
+        warm.reset();
         cost = boundcost;
-        for (unsigned i = 0; i < res.rows(); ++i) {
-            solution[rmap[i]] = cmap[res[i]];
-            cost += C(i, res[i]);
+        for (int i = 0; i < rows(); ++i) {
+            if (active(i)) {
+                solution[i] = lp->x[i] < costs->cols() ? lp->x[i] : -1;
+                cost += costs->coeff(i, lp->x[i]);
+            }
         }
-        //std::cout << "Solution: [" << res.transpose() << "] " << cost << std::endl;
-        solved = true;
-        return (cost < lap::inf);
+        //std::cout << "Solution: [" << solution.transpose() << "] " << cost << std::endl;
+        return true;
     }
 
     MurtyState::Slacklist minslack() const {
-        std::vector<std::tuple<double, unsigned, unsigned>> mslack(C.rows());
-        double h;
-        for (unsigned i = 0; i < C.rows(); ++i) {
-            mslack[i] = {C(i, 0) - u[i] - v[0], i, res[i]};
-            for (unsigned j = 1; j < C.cols(); ++j) {
-                if (static_cast<int>(j) == res[i]) {
-                    continue;
-                }
-
-                h = C(i, j) - u[i] - v[j];
-                if (h < std::get<0>(mslack[i])) {
-                    mslack[i] = {h, i, res[i]};
-                }
+        // Rows without alternative entries cannot be partitioned away from
+        // their assignment, and are given infinite slack.
+        const Assignment& x = lp->x;
+        const Slack& u = lp->u;
+        const Slack& v = lp->v;
+        MurtyState::Slacklist mslack;
+        mslack.reserve(nfree);
+        for (int i = 0; i < rows(); ++i) {
+            if (!active(i)) {
+                continue;
             }
+            double h = std::numeric_limits<double>::infinity();
+            entries(i, [&](const int j, const double c) {
+                if (j != x[i]) {
+                    h = std::min(h, c - u[i] - v[j]);
+                }
+            });
+            mslack.emplace_back(h, i, x[i]);
         }
         std::sort(mslack.rbegin(), mslack.rend());
         return mslack;
@@ -193,7 +262,7 @@ struct MurtyStatePtrCompare {
         if (a->cost > b->cost) {
             return true;
         } else if (a->cost == b->cost) {
-            return a->C.rows() > b->C.rows();
+            return a->nfree > b->nfree;
         } else {
             return false;
         }
@@ -201,27 +270,59 @@ struct MurtyStatePtrCompare {
 };
 
 class Murty {
- private:
-    double offset;
-
  public:
-    explicit Murty(CostMatrix C) {
-        double min = C.minCoeff();
-        offset = 0;
-        if (min < 0) {
-            C.array() -= min;
-            offset = min * C.rows();
+    explicit Murty(const CostMatrix& C)
+    : Murty(sparse(C)) {}
+
+    explicit Murty(SparseCostMatrix C)
+    : Murty(std::move(C), Slack(0)) {}
+
+    Murty(const CostMatrix& C, const Slack& unassigned)
+    : Murty(sparse(C), unassigned) {}
+
+    Murty(SparseCostMatrix C, Slack unassigned)
+    : nrows(C.rows()), ncols(C.cols()) {
+        // Entries not stored in a sparse cost matrix are forbidden. If given,
+        // row i may be left unassigned at cost unassigned[i], and is then
+        // assigned to column -1 in the solutions. The states of the
+        // partitions share the base problem.
+        if (unassigned.size() != 0 && unassigned.size() != C.rows()) {
+            throw std::invalid_argument("Expected one unassigned cost per row.");  // NOLINT
         }
-        queue.emplace(std::make_shared<MurtyState>(C));
+        queue.emplace(std::make_shared<MurtyState>(
+            std::make_shared<const MurtyCosts>(std::move(C), std::move(unassigned))));  // NOLINT
     }
 
-    void get_partition_index(const MurtyState::Slacklist& partition_order, MurtyState::Slacklist::iterator p, unsigned& i, unsigned& j) {
-        i = std::get<1>(*p);
-        j = std::get<2>(*p);
-        for (auto pp = partition_order.begin(); pp != p; ++pp) {
-            if (std::get<1>(*pp) < std::get<1>(*p)) { --i; }
-            if (std::get<2>(*pp) < std::get<2>(*p)) { --j; }
+    unsigned rows() const { return nrows; }
+    unsigned cols() const { return ncols; }
+
+    void seed(const Assignment& x, const Slack& v) {
+        // Seed the first solution with the assignment x, -1 for unassigned
+        // rows and -2 for rows without a hint, and the column duals v, of a
+        // related solved problem. See lap::resume.
+        if (drawn || queue.size() != 1) {
+            throw std::logic_error("Seeding after drawing.");
         }
+        auto& s = queue.top();
+        if (x.size() != s->rows() || v.size() != s->cols()) {
+            throw std::invalid_argument("Expected one seed per row and column.");  // NOLINT
+        }
+        auto hint = std::make_shared<MurtySolution>();
+        hint->x = x;
+        hint->v = v;
+        for (int i = 0; i < x.size(); ++i) {
+            if (x[i] == -1) {
+                hint->x[i] = s->costs->cols() + i;
+            } else if (x[i] < -1 || x[i] >= s->costs->cols()) {
+                hint->x[i] = -1;
+            }
+        }
+        s->warm = hint;
+    }
+
+    std::shared_ptr<const MurtySolution> first_solution() const {
+        // Assignment and duals of the first solution, once drawn
+        return first;
     }
 
     using ReturnTuple = std::tuple<bool, double, Assignment>;
@@ -232,9 +333,23 @@ class Murty {
         return {ok, cost, sol};
     }
 
-    bool draw(Assignment& sol, double& cost) {
+    template<typename Costs, typename Solutions>
+    unsigned draw_k(const unsigned k, const double max_cost, Costs& costs, Solutions& solutions) {  // NOLINT
+        // Draw up to k solutions costing at most max_cost, appending their
+        // costs to costs and their assignments, row by row, to solutions.
+        Assignment sol;
+        double cost;
+        unsigned n = 0;
+        for (; n < k && draw(sol, cost, max_cost); ++n) {
+            costs.push_back(cost);
+            solutions.insert(solutions.end(), sol.data(), sol.data() + sol.size());  // NOLINT
+        }
+        return n;
+    }
+
+    bool draw(Assignment& sol, double& cost, const double max_cost = std::numeric_limits<double>::infinity()) {  // NOLINT
+        // Solutions costing more than max_cost are left for later draws.
         std::shared_ptr<MurtyState> s;
-        unsigned i, j;
         //std::cout << "Draw! Queue size: " << queue.size() << std::endl;
 
         if (queue.empty()) {
@@ -243,7 +358,7 @@ class Murty {
 
         for (s = queue.top(); !s->solved; s = queue.top()) {
             queue.pop();
-            if (s->solve()) {
+            if (s->solve(msc)) {
                 queue.push(s);
             }
             if (queue.empty()) {
@@ -251,40 +366,39 @@ class Murty {
                 return false;
             }
         }
-        queue.pop();
-        sol = s->solution;
-        cost = s->cost + offset;
-        if (cost > lap::inf) {
+        if (s->cost > max_cost) {
             return false;
         }
+        queue.pop();
+        if (!drawn) {
+            first = s->lp;
+            drawn = true;
+        }
+        sol = s->solution;
+        cost = s->cost;
         //std::cout << "Solution: " << sol.transpose() << std::endl;
         //std::cout << "Cost: " << cost << std::endl;
-        //std::cout << "res: " << s->res.transpose() << std::endl;
-        //std::cout << "rmap: ";
-        //for (auto& r : s->rmap) {
-            //std::cout << r << ", ";
-        //}
-        //std::cout << std::endl;
-        //std::cout << "cmap: ";
-        //for (auto& c : s->cmap) {
-            //std::cout << c << ", ";
-        //}
-        //std::cout << std::endl;
-        //std::cout << s->C << std::endl;
 
+        // Partitions are indexed in the base problem. The node accumulates
+        // the bindings of the preceding partitions.
         auto partition_order = s->minslack();
-        auto p = partition_order.begin();
-        auto node = s;
-
-        for (; p != partition_order.end(); ++p) {
-            get_partition_index(partition_order, p, i, j);
-            queue.push(node->partition_without(i, j, std::get<0>(*p)));
-            node = node->partition_with(i, j);
+        auto node = std::make_shared<MurtyState>(s.get());
+        for (auto& [slack, i, j] : partition_order) {
+            if (slack < std::numeric_limits<double>::infinity()) {
+                queue.push(node->partition_without(i, j, slack));
+            }
+            node->bind(i, j);
         }
         return true;
     }
 
+    // Re-solve partitions from their parent solutions (Miller, Stone & Cox)
+    bool msc = true;
+
  private:
+    unsigned nrows, ncols;
+    bool drawn = false;
+    std::shared_ptr<const MurtySolution> first;
     std::priority_queue<MurtyStatePtr, std::vector<MurtyStatePtr>, MurtyStatePtrCompare> queue;
 };
 }
@@ -24,7 +24,8 @@ import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import mht
-from mht.cluster import Cluster
+from mht.cluster import Cluster, ScoreTable
+from mht.track import Track
 
 
 class TestClusterInit(unittest.TestCase):
@@ -129,3 +130,116 @@ class TestClustering(unittest.TestCase):
         for c in split_clusters:
             self.assertEqual(len(c.hypotheses), 1)
         self.assertEqual(self.initer.call_count, 3)
+
+
+class TestClusterBBox(unittest.TestCase):
+    """Test the cached cluster boundingbox."""
+
+    def setUp(self):
+        """Set up."""
+        self.initer = MagicMock()
+        self.clusters = [Cluster.initial(self.initer, [
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 10.0 * i, 1.0, 1.0]),
+                np.eye(4)
+            )]) for i in range(2)]
+
+    def test_cached(self):
+        """Test that the box is computed once."""
+        c = self.clusters[0]
+        bbox = c.bbox()
+        with patch('mht.cluster.bbox_union') as union:
+            self.assertEqual(c.bbox(), bbox)
+            union.assert_not_called()
+
+    def test_predict(self):
+        """Test that predict invalidates the box."""
+        c = self.clusters[0]
+        bbox = c.bbox()
+        c.predict(1)
+        self.assertGreater(c.bbox()[0], bbox[0])
+        self.assertEqual(c.bbox(), c.targets[0].tracks[None].bbox())
+
+    def test_merge(self):
+        """Test that a merged cluster covers both clusters."""
+        boxes = [c.bbox() for c in self.clusters]
+        merged = Cluster.merge(self.initer, self.clusters)
+        self.assertEqual(merged.bbox(), (boxes[0][0], boxes[0][1],
+                                         boxes[0][2], boxes[1][3]))
+
+
+class TestNScan(unittest.TestCase):
+    """Test N-scan pruning."""
+
+    def run_tracker(self, n_scan, scans=5):
+        """Track two close targets through ambiguous scans."""
+        tracker = mht.MHT(cparams=mht.ClusterParameters(n_scan=n_scan))
+        tracker.initiate_clusters([
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 0.0, 1.0, 1.0]),
+                np.eye(4)
+            ),
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 3.0, 1.0, -1.0]),
+                np.eye(4)
+            )
+        ])
+        sensor = mht.sensors.EyeOfMordor(3, 12)
+        for k in range(1, scans + 1):
+            tracker.predict(1)
+            tracker.register_scan(mht.Scan(sensor, [
+                mht.Report(np.array([float(k), 1.5]), np.eye(2),
+                           mht.models.position_measurement, 0),
+                mht.Report(np.array([float(k), 2.0]), np.eye(2),
+                           mht.models.position_measurement, 1)]))
+        tracker._load_clusters()
+        clusters = list(tracker.active_clusters)
+        tracker.close()
+        return clusters
+
+    def test_committed(self):
+        """Test that all hypotheses agree with the best one scan back."""
+        for c in self.run_tracker(1):
+            committed = {tr.target: tr.ancestor(1)
+                         for tr in c.best_hypothesis().tracks}
+            for h in c.hypotheses:
+                for tr in h.tracks:
+                    self.assertLessEqual(len(tr.history), 1)
+                    if tr.target in committed:
+                        self.assertEqual(tr.ancestor(1),
+                                         committed[tr.target])
+
+    def test_disabled(self):
+        """Test that no history is kept without N-scan pruning."""
+        for c in self.run_tracker(None, 2):
+            for h in c.hypotheses:
+                for tr in h.tracks:
+                    self.assertEqual(tr.history, ())
+                    self.assertIsNone(tr.ancestor(1))
+
+
+class TestScoreTable(unittest.TestCase):
+    """Test the per-scan score table."""
+
+    def test_scores(self):
+        """Test that shared tracks are scored once."""
+        sensor = mht.sensors.EyeOfMordor(3, 12)
+        cluster = Cluster.initial(MagicMock(), [
+            mht.kf.KFilter(mht.models.ConstantVelocityModel(0.1),
+                           np.array([2.0 * i, 0.0, 0.0, 0.0]), np.eye(4))
+            for i in range(3)])
+        tracks = [t.tracks[None] for t in cluster.targets]
+        reports = [mht.Report(np.array([1.0, float(i)]), np.eye(2),
+                              mht.models.position_measurement)
+                   for i in range(2)]
+        table = ScoreTable(reports, sensor)
+        expected = Track.match_scores(tracks, reports, sensor)
+
+        np.testing.assert_allclose(table.scores(tracks[0:2]), expected[0:2])
+        np.testing.assert_allclose(table.scores(tracks[1:3]), expected[1:3])
+        self.assertEqual(table.hits, 1)
+        self.assertEqual(table.misses, 3)
+        self.assertEqual(table.scores([]).shape, (0, 2))
@@ -17,11 +17,15 @@
 
 import unittest
 import numpy as np
+from itertools import islice, permutations, product as cartesian
+from scipy.sparse import csr_matrix, block_diag
 import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from mht.hypgen import murty, permgen
+from mht.solvers import extension
+from mht.hypgen import murty, permgen, product, kbest_assignments, \
+    MurtySession, KBestMerge
 
 MURTY_COST = np.matrix([[7, 51, 52, 87, 38, 60, 74, 66, 0, 20],
                         [50, 12, 0, 64, 8, 53, 0, 46, 76, 42],
@@ -46,6 +50,7 @@ MURTY_COST = np.matrix([[7, 51, 52, 87, 38, 60, 74, 66, 0, 20],
             # res[0])
 
 
+@unittest.skipUnless(extension(), "murty extension not built")
 class TestMurty(unittest.TestCase):
     """Test Murty algorithm."""
 
@@ -94,6 +99,136 @@ class TestMurty(unittest.TestCase):
             n += 1
         self.assertEqual(n, 90)
 
+    def test_murty_sparse(self):
+        """Test that entries not stored in sparse inputs are forbidden."""
+        mask = np.asarray(MURTY_COST[:4, :6]) > 10
+        C = csr_matrix((np.asarray(MURTY_COST[:4, :6])[mask], mask.nonzero()),
+                       shape=(4, 6))
+        expected = sorted(
+            sum(MURTY_COST[i, j] for i, j in enumerate(p))
+            for p in permutations(range(6), 4)
+            if all(mask[i, j] for i, j in enumerate(p)))
+        res = list(murty(C))
+        self.assertEqual([r[0] for r in res], expected)
+        for cost, sol in res:
+            self.assertTrue(mask[range(4), sol].all())
+
+    def test_murty_unassigned(self):
+        """Test unassigned row costs against explicit extraneous columns."""
+        C = np.asarray(MURTY_COST[:3, :4], dtype=float)
+        unassigned = np.array([20.0, 5.0, 30.0])
+        explicit = np.full((3, 7), 10000.0)
+        explicit[:, :4] = C
+        explicit[range(3), range(4, 7)] = unassigned
+        expected = list(murty(explicit))
+        res = list(murty(C, unassigned))
+        self.assertEqual(len(res), 4 * 3 * 2 + 3 * (4 * 3) + 3 * 4 + 1)
+        self.assertEqual([r[0] for r in res],
+                         [r[0] for r in expected[:len(res)]])
+        for cost, sol in res:
+            self.assertEqual(cost, sum(unassigned[i] if j < 0 else C[i, j]
+                                       for i, j in enumerate(sol)))
+
+    def test_murty_draw_k(self):
+        """Test batched draws against single draws."""
+        C = np.asarray(MURTY_COST[:5, :6], dtype=float)
+        expected = []
+        m = extension().Murty(C)
+        for _ in range(30):
+            ok, cost, sol = m.draw()
+            expected.append((cost, list(sol)))
+        m = extension().Murty(C)
+        costs, sols = m.draw_k(30, expected[9][0])
+        self.assertEqual(sols.shape, (len(costs), 5))
+        self.assertGreater(expected[len(costs)][0], expected[9][0])
+        more, more_sols = m.draw_k(30 - len(costs))
+        costs = np.concatenate((costs, more))
+        sols = np.concatenate((sols, more_sols))
+        self.assertEqual([(c, list(s)) for c, s in zip(costs, sols)],
+                         expected)
+
+    def test_murty_msc(self):
+        """Test re-solved partitions against partitions solved anew."""
+        mask = np.asarray(MURTY_COST[:6, :8]) > 5
+        C = csr_matrix((np.asarray(MURTY_COST[:6, :8], dtype=float)[mask],
+                        mask.nonzero()), shape=(6, 8))
+        unassigned = np.arange(6) * 10.0 + 20
+        for args in ((C,), (C, unassigned), (MURTY_COST[:6, :],)):
+            expected = [r[0] for r in murty(*args, msc=False)]
+            res = [r[0] for r in murty(*args, msc=True)]
+            self.assertEqual(res, expected)
+
+    def test_murty_session(self):
+        """Test seeded problems against problems solved anew."""
+        C = np.asarray(MURTY_COST, dtype=float)
+        unassigned = np.full(6, 25.0)
+        session = MurtySession()
+        for cols in ([0, 1, 2, 3, 4, 5, 6], [1, 2, 3, 4, 5, 6, 7],
+                     [7, 6, 5, 4, 3, 2, 1, 0], [8, 9, 0, 5], [2, 7]):
+            expected = list(murty(C[:6, cols], unassigned))
+            res = list(session.murty(C[:6, cols], unassigned, cols))
+            self.assertEqual([r[0] for r in res], [r[0] for r in expected])
+            self.assertEqual(session.assignment,
+                             [cols[j] if j >= 0 else None
+                              for j in res[0][1]])
+
+
+class TestKBest(unittest.TestCase):
+    """Test decomposed k-best assignments."""
+
+    def test_product(self):
+        """Test ordered products of ordered lists."""
+        D = [[(1, 'a'), (1, 'b'), (2, 'c')],
+             [(0, 'd'), (2, 'e'), (5, 'f')],
+             [(3, 'g')],
+             [(1, 'h'), (4, 'i')]]
+        res = list(product(iter(l) for l in D))
+        expected = sorted(sum(c for c, _ in combo)
+                          for combo in cartesian(*D))
+        self.assertEqual([r[0] for r in res], expected)
+        self.assertEqual(len({tuple(r[1]) for r in res}), len(expected))
+        self.assertEqual(res[0], (5, ['a', 'd', 'g', 'h']))
+        self.assertEqual(list(product([D[0], []])), [])
+
+    def test_merge(self):
+        """Test lazy ordered merges of bounded streams."""
+        drawn = []
+
+        def stream(name, costs):
+            for c in costs:
+                drawn.append(name)
+                yield c, name
+
+        streams = [(1, stream('a', [1, 4, 6])), (0, stream('b', [2, 3, 7])),
+                   (5, stream('c', [5, 5])), (8, stream('d', [8]))]
+        merge = KBestMerge(streams, k=5)
+        self.assertEqual(list(merge), [(1, 'a'), (2, 'b'), (3, 'b'),
+                                       (4, 'a'), (5, 'c')])
+        self.assertNotIn('d', drawn)
+        self.assertEqual((merge.opened, merge.pulled, merge.emitted),
+                         (3, 7, 5))
+
+        costs = [0.0, 0.1, 3.0, 20.0]
+        merge = KBestMerge([(0, stream('e', costs))], limit=5)
+        self.assertEqual([c for c, _ in merge], costs[:3])
+        self.assertEqual(list(KBestMerge(streams, k=0)), [])
+
+    @unittest.skipUnless(extension(), "murty extension not built")
+    def test_blocks(self):
+        """Test that independent blocks give the same stream as Murty."""
+        C = block_diag([np.asarray(MURTY_COST[:3, :3]),
+                        np.asarray(MURTY_COST[3:5, 3:7]),
+                        np.asarray(MURTY_COST[5:7, 7:9])], format='csr')
+        unassigned = np.full(7, 30.0)
+        expected = list(murty(C, unassigned))
+        res = list(kbest_assignments(C, unassigned))
+        self.assertEqual([r[0] for r in res], [r[0] for r in expected])
+        self.assertEqual(len({tuple(r[1]) for r in res}), len(res))
+        dense = C.toarray()
+        for cost, sol in res:
+            self.assertEqual(cost, sum(unassigned[i] if j < 0 else dense[i, j]
+                                       for i, j in enumerate(sol)))
+
 
 class TestPermgen(unittest.TestCase):
     """Test permutation generation."""
@@ -108,6 +243,29 @@ class TestPermgen(unittest.TestCase):
             k += 1
         self.assertEqual(k, 9)
 
+    def test_permgen_order(self):
+        """Test permgen order, next costs and uniqueness."""
+        D = [[(2, 'a'), (0, 'b'), (1, 'c')],
+             [(1, 'd'), (1, 'e')],
+             [],
+             [(0, 'f'), (3, 'g'), (0, 'h')]]
+        D = [l for l in D if l]
+        costs = {d: c for l in D for c, d in l}
+        res = list(permgen(D))
+        res_costs = [sum(costs[d] for d in r[0]) for r in res]
+        self.assertEqual(res_costs, sorted(sum(c for c, _ in combo)
+                                           for combo in cartesian(*D)))
+        self.assertEqual([r[1] for r in res], res_costs[1:] + [None])
+        self.assertEqual(len({tuple(r[0]) for r in res}), len(res))
+        self.assertEqual(list(permgen([])), [([], None)])
+
+    def test_permgen_many(self):
+        """Test permgen with many lists."""
+        D = [[(0.5 * i, i), (i + 1.0, -i - 1)] for i in range(300)]
+        res = list(islice(permgen(D, True), 100))
+        self.assertEqual(res[0][0], list(range(300)))
+        self.assertEqual(len({tuple(r[0]) for r in res}), 100)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -16,6 +16,7 @@
 """
 
 import unittest
+from copy import deepcopy
 import numpy as np
 import os
 import sys
@@ -49,3 +50,44 @@ class TestKFTarget(unittest.TestCase):
         self.assertAlmostEqual(self.target.x[1], 0.0)
         self.assertAlmostEqual(self.target.x[2], 1.0)
         self.assertAlmostEqual(self.target.x[3], 1.0)
+
+    def test_nll_matrix(self):
+        """Batched nll scores equal the pairwise scores."""
+        rng = np.random.RandomState(0)
+        filters = [self.target] + [
+            mht.kf.KFilter(mht.models.ConstantVelocityModel(0.1),
+                           rng.normal(0, 3, 4),
+                           np.diag(rng.uniform(0.5, 2, 4)))
+            for _ in range(4)]
+        reports = [
+            mht.Report(rng.normal(0, 3, 2), np.eye(2) * rng.uniform(0.1, 1),
+                       mht.models.position_measurement)
+            for _ in range(5)] + [
+            mht.Report(rng.normal(0, 1, 2), np.eye(2),
+                       mht.models.velocity_measurement)]
+        scores = mht.kf.nll_matrix(filters, reports)
+        np.testing.assert_allclose(
+            scores, [[f.nll(r) for r in reports] for f in filters])
+
+    def test_correct_innovation(self):
+        """Correction with a stored innovation equals plain correction."""
+        rng = np.random.RandomState(1)
+        filters = [self.target, mht.kf.KFilter(
+            mht.models.ConstantVelocityModel(0.1),
+            rng.normal(0, 3, 4), np.diag(rng.uniform(0.5, 2, 4)))]
+        reports = [mht.Report(rng.normal(0, 3, 2), np.eye(2) * 0.5,
+                              mht.models.position_measurement)
+                   for _ in range(3)]
+        innovations = mht.kf.Innovations()
+        mht.kf.nll_matrix(filters, reports, innovations)
+        for f in filters:
+            for r in reports:
+                innovation = innovations.get(f, r)
+                self.assertIsNotNone(innovation)
+                a, b = deepcopy(f), deepcopy(f)
+                score = a.correct(r, innovation)
+                self.assertAlmostEqual(score, b.correct(r))
+                np.testing.assert_allclose(a.x, b.x)
+                np.testing.assert_allclose(a.P, b.P)
+        self.assertIsNone(innovations.get(filters[0], mht.Report(
+            np.zeros(2), np.eye(2), mht.models.position_measurement)))
@@ -15,7 +15,9 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import asyncio
 import unittest
+from unittest.mock import patch
 import numpy as np
 import os
 import sys
@@ -97,5 +99,249 @@ class TestMHT(unittest.TestCase):
                 mht.sensors.EyeOfMordor(3, 12), reports))
 
 
+class TestMHTMerge(unittest.TestCase):
+    """Test merging of clusters bridged by reports."""
+
+    def setUp(self):
+        """Set up testcase."""
+        self.tracker = mht.MHT()
+        self.tracker.initiate_clusters([
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 10.0 * i, 0.0, 0.0]),
+                np.eye(4)
+            ) for i in range(3)])
+
+    def tearDown(self):
+        """Tear down testcase."""
+        self.tracker.close()
+
+    def test_merge_component_once(self):
+        """Test that a chain of bridging reports merges only once."""
+        self.tracker.register_scan(mht.Scan(
+            mht.sensors.EyeOfMordor(3, 12), [
+                mht.Report(np.array([0.0, 5.0]), np.eye(2) * 4,
+                           mht.models.position_measurement),
+                mht.Report(np.array([0.0, 15.0]), np.eye(2) * 4,
+                           mht.models.position_measurement)]))
+        self.assertEqual(self.tracker.nmerges, 1)
+        self.assertEqual(self.tracker.nmerges_avoided, 1)
+        self.assertEqual(self.tracker.npresplit, 1)
+
+
+class TestMHTGlobalHypotheses(unittest.TestCase):
+    """Test extraction of global hypotheses."""
+
+    def setUp(self):
+        """Set up tracker with ambiguous clusters."""
+        self.tracker = self.make_tracker("memory")
+
+    def make_tracker(self, matching_algorithm):
+        """Create tracker with two ambiguous clusters."""
+        tracker = mht.MHT(matching_algorithm=matching_algorithm)
+        tracker.initiate_clusters([
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 3.0 * i + 50.0 * (i // 2), 1.0, 1.0]),
+                np.eye(4)
+            ) for i in range(4)])
+        tracker.predict(1)
+        tracker.register_scan(mht.Scan(
+            mht.sensors.EyeOfMordor(3, 12), [
+                mht.Report(np.array([1.0, 1.5 + 3.0 * i + 50.0 * (i // 2)]),
+                           np.eye(2), mht.models.position_measurement, i)
+                for i in range(4)]))
+        return tracker
+
+    def tearDown(self):
+        """Tear down testcase."""
+        self.tracker.close()
+
+    def test_best(self):
+        """Test that the best hypothesis is the first one generated."""
+        first = next(self.tracker.global_hypotheses())
+        best = self.tracker.best_global_hypothesis()
+        self.assertEqual(set(best.cluster_hypotheses),
+                         set(first.cluster_hypotheses))
+        self.assertAlmostEqual(best.score(), first.score())
+        self.assertEqual(len(best.targets), 4)
+
+    def test_top_k(self):
+        """Test lazy top k generation."""
+        hyps = list(self.tracker.top_k(3))
+        self.assertEqual(len(hyps), 3)
+        scores = [sum(h.score() for h in g.cluster_hypotheses) for g in hyps]
+        self.assertEqual(scores, sorted(scores))
+        self.assertEqual(len(list(self.tracker.top_k(1000))),
+                         len(list(self.tracker.global_hypotheses())))
+
+    def test_cache(self):
+        """Test that cluster results are cached until the cluster changes."""
+        c = max(self.tracker.clusters.values(),
+                key=lambda c: len(c.hypotheses))
+        best = c.best_hypothesis()
+        self.assertIs(c.ranked_hypotheses(), c.ranked_hypotheses())
+        self.assertIs(c.best_hypothesis(), best)
+        self.tracker.register_scan(mht.Scan(
+            mht.sensors.EyeOfMordor(3, 12), []))
+        c = self.tracker.clusters[c._id]
+        self.assertIsNot(c.best_hypothesis(), best)
+
+    def test_stored(self):
+        """Test that stored clusters are not ranked again when loaded."""
+        tracker = self.make_tracker(None)
+        self.addCleanup(tracker.close)
+        expected = [g.score() for g in self.tracker.top_k(3)]
+        with patch('mht.clusterhyp.ClusterHypothesis.score',
+                   side_effect=AssertionError):
+            best = tracker.best_global_hypothesis()
+            hyps = list(tracker.top_k(3))
+        self.assertEqual(len(best.targets), 4)
+        self.assertAlmostEqual(best.score(), expected[0])
+        for g, score in zip(hyps, expected):
+            self.assertAlmostEqual(g.score(), score)
+
+
+class TestMHTRun(unittest.TestCase):
+    """Test the asyncio scan pipeline."""
+
+    def make_tracker(self, **kwargs):
+        """Create tracker with two targets."""
+        tracker = mht.MHT(**kwargs)
+        tracker.initiate_clusters([
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 10.0 * i, 1.0, 1.0]),
+                np.eye(4)
+            ) for i in range(2)])
+        self.addCleanup(tracker.close)
+        return tracker
+
+    def scans(self):
+        """Generate timestamped scans."""
+        return [(float(k), mht.Scan(mht.sensors.EyeOfMordor(3, 12), [
+            mht.Report(np.array([float(k), 10.0 * i + k]), np.eye(2) * 0.1,
+                       mht.models.position_measurement, i)
+            for i in range(2)])) for k in range(1, 5)]
+
+    async def source(self):
+        """Yield scans asynchronously."""
+        for item in self.scans():
+            await asyncio.sleep(0)
+            yield item
+
+    async def consume(self, tracker, limit=None):
+        """Run tracker on the scans."""
+        times = []
+        async for t, clusters in tracker.run(self.source(), t0=0.0):
+            times.append(t)
+            self.assertTrue(clusters)
+            if len(times) == limit:
+                break
+        return times
+
+    def test_run(self):
+        """Test that run gives the same result as stepping."""
+        reference = self.make_tracker()
+        last = 0.0
+        for t, scan in self.scans():
+            reference.predict(t - last)
+            reference.register_scan(scan)
+            last = t
+        expected = next(reference.global_hypotheses()).score()
+
+        for algorithm in (None, "memory"):
+            tracker = self.make_tracker(matching_algorithm=algorithm)
+            times = asyncio.run(self.consume(tracker))
+            self.assertEqual(times, [1.0, 2.0, 3.0, 4.0])
+            self.assertEqual(tracker.dirty_clusters, {})
+            self.assertEqual(len(tracker.query_clusters()), 2)
+            self.assertAlmostEqual(
+                next(tracker.global_hypotheses()).score(), expected)
+
+    def test_close_early(self):
+        """Test that pending writes are completed when closing early."""
+        tracker = self.make_tracker(matching_algorithm="memory")
+        asyncio.run(self.consume(tracker, limit=2))
+        stored = {c._id: c for c in tracker.query_clusters()}
+        self.assertEqual(set(stored), set(tracker.clusters))
+        for i, c in tracker.clusters.items():
+            self.assertEqual(stored[i].bbox(), c.bbox())
+
+
+class TestMHTStore(unittest.TestCase):
+    """Test the cluster store."""
+
+    def setUp(self):
+        """Set up testcase."""
+        self.tracker = mht.MHT(db_pragmas={"synchronous": "OFF"},
+                               id_block_size=4)
+        self.tracker.initiate_clusters([
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 10.0 * i, 1.0, 1.0]),
+                np.eye(4)
+            ) for i in range(3)])
+
+    def tearDown(self):
+        """Tear down testcase."""
+        self.tracker.close()
+
+    def test_pragmas(self):
+        """Test that pragmas are applied to the connection."""
+        (sync,) = self.tracker.db.execute("PRAGMA synchronous;").fetchone()
+        self.assertEqual(sync, 0)
+
+    def test_id_blocks(self):
+        """Test that cluster ids are reserved in blocks."""
+        ids = [self.tracker._new_cluster_id() for _ in range(6)]
+        self.assertEqual(len(set(ids)), 6)
+        self.assertEqual(ids, list(range(4, 10)))
+        (seq,) = self.tracker.db.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name='clusters';"
+        ).fetchone()
+        self.assertEqual(seq, 12)
+
+    def test_dirty_only(self):
+        """Test that only dirty clusters are written."""
+        self.tracker._load_clusters()
+        self.assertEqual(self.tracker.dirty_clusters, {})
+        (c, *_) = self.tracker.active_clusters
+        c.hypotheses[0].total_score = 42
+        self.tracker._save_clusters([c])
+        self.assertEqual(self.tracker.dirty_clusters, {})
+        self.tracker._load_clusters()
+        (loaded,) = [lc for lc in self.tracker.active_clusters
+                     if lc._id == c._id]
+        self.assertEqual(loaded.hypotheses[0].total_score, 42)
+
+        tracker = mht.MHT(matching_algorithm="naive")
+        tracker.initiate_clusters([
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 10.0 * i, 1.0, 1.0]),
+                np.eye(4)
+            ) for i in range(3)])
+        changes = tracker.dbc.total_changes
+        tracker.register_scan(mht.Scan(
+            mht.sensors.Satellite((-5, 5, -5, 5), 3, 12), [
+                mht.Report(np.array([0.0, 0.0]), np.eye(2) * 0.1,
+                           mht.models.position_measurement, 0)]))
+        written = tracker.dbc.total_changes - changes
+        tracker.close()
+        self.assertEqual(written, len(tracker.active_clusters))
+        self.assertLess(written, len(tracker.query_clusters()))
+
+    def test_deleted_not_saved(self):
+        """Test that deleted clusters are dropped from the dirty set."""
+        self.tracker._load_clusters()
+        clusters = set(self.tracker.active_clusters)
+        self.tracker._mark_dirty(clusters)
+        self.tracker._delete_clusters(clusters)
+        self.tracker._save_clusters()
+        self.tracker._load_clusters()
+        self.assertEqual(len(self.tracker.active_clusters), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+"""Test tracker instrumentation."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mht
+from mht.profiling import NOSTATS
+
+
+def run(tracker):
+    """Track two targets over a few scans."""
+    tracker.initiate_clusters([
+        mht.kf.KFilter(
+            mht.models.ConstantVelocityModel(0.1),
+            np.array([0.0, 3.0 * i, 1.0, 1.0]),
+            np.eye(4)
+        ) for i in range(2)])
+    for k in range(1, 4):
+        tracker.predict(1)
+        tracker.register_scan(mht.Scan(mht.sensors.EyeOfMordor(3, 12), [
+            mht.Report(np.array([float(k), 3.0 * i + k]), np.eye(2),
+                       mht.models.position_measurement, i)
+            for i in range(2)]))
+
+
+class TestStats(unittest.TestCase):
+    """Test the statistics object."""
+
+    def test_stages(self):
+        """Test that stages are timed and clusters counted."""
+        callback = MagicMock()
+        stats = mht.Stats(callback)
+        tracker = mht.MHT(stats=stats)
+        self.addCleanup(tracker.close)
+        run(tracker)
+
+        for stage in ('load', 'cluster', 'predict', 'correct', 'split',
+                      'serialize', 'write'):
+            self.assertIn(stage, stats.stages)
+        self.assertEqual(stats.stages['correct'].count, 3)
+        self.assertEqual(stats.counters['reports'], 6)
+        self.assertGreater(stats.counters['parent_hyps'], 0)
+        self.assertGreater(stats.counters['bytes_serialized'], 0)
+        self.assertGreaterEqual(stats.counters['murty_draws'],
+                                stats.counters['hyps_generated'])
+        self.assertGreaterEqual(stats.counters['hyps_generated'],
+                                stats.counters['hyps_kept'])
+        self.assertGreater(stats.counters['parents_drawn'], 0)
+        self.assertTrue(any(c['hyps_kept'] for c in stats.clusters.values()))
+        self.assertGreater(stats.counters['score_misses'], 0)
+        self.assertEqual(callback.call_count,
+                         sum(s.count for s in stats.stages.values()))
+        self.assertIn('correct', str(stats))
+
+        stats.reset()
+        self.assertEqual(stats.as_dict(),
+                         {'stages': {}, 'counters': {}, 'clusters': {}})
+
+    def test_disabled(self):
+        """Test that trackers without stats use the null object."""
+        tracker = mht.MHT()
+        self.addCleanup(tracker.close)
+        self.assertIs(tracker.stats, NOSTATS)
+        run(tracker)
+        with NOSTATS.stage('load'):
+            NOSTATS.count('reports')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""Test cluster serialization."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from unittest.mock import patch
+import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mht
+from mht import serialize
+
+
+class TestSerialize(unittest.TestCase):
+    """Test the binary cluster format."""
+
+    def setUp(self):
+        """Set up a tracker with ambiguous hypotheses."""
+        self.tracker = mht.MHT(cparams=mht.ClusterParameters(n_scan=2))
+        self.tracker.initiate_clusters([
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 0.0, 1.0, 1.0]),
+                np.eye(4)
+            ),
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 3.0, 1.0, -1.0]),
+                np.eye(4)
+            )
+        ])
+        self.sensor = mht.sensors.EyeOfMordor(3, 12)
+        self.tracker.predict(1)
+        self.tracker.register_scan(mht.Scan(self.sensor, [
+            mht.Report(np.array([1.0, 1.5]), np.eye(2),
+                       mht.models.position_measurement, 0),
+            mht.Report(np.array([1.0, 2.0]), np.eye(2),
+                       mht.models.position_measurement, 1)]))
+        self.tracker._load_clusters()
+        self.cluster = max(self.tracker.active_clusters,
+                           key=lambda c: len(c.hypotheses))
+
+    def tearDown(self):
+        """Tear down."""
+        self.tracker.close()
+
+    def assertSameCluster(self, a, b):
+        """Check that two clusters hold the same data."""
+        self.assertEqual(a._id, b._id)
+        self.assertEqual([h.score() for h in a.hypotheses],
+                         [h.score() for h in b.hypotheses])
+        for ha, hb in zip(a.hypotheses, b.hypotheses):
+            self.assertEqual([tr._trid for tr in ha.tracks],
+                             [tr._trid for tr in hb.tracks])
+            for ta, tb in zip(ha.tracks, hb.tracks):
+                np.testing.assert_array_equal(ta.filter.x, tb.filter.x)
+                np.testing.assert_array_equal(ta.filter.P, tb.filter.P)
+                self.assertEqual(len(ta.filter.trace),
+                                 len(tb.filter.trace))
+                self.assertEqual(ta.score(), tb.score())
+                self.assertEqual(ta.sources, tb.sources)
+                self.assertEqual(ta.history, tb.history)
+                self.assertEqual(ta.report_id(), tb.report_id())
+        self.assertEqual(len(a.ambiguous_tracks), len(b.ambiguous_tracks))
+        self.assertEqual({t._id for t in a.targets},
+                         {t._id for t in b.targets})
+
+    def test_roundtrip(self):
+        """Test that a cluster survives a roundtrip."""
+        blob = serialize.dumps(self.cluster)
+        self.assertEqual(blob[:4], serialize.MAGIC)
+        c = serialize.loads(blob, self.tracker.cparams)
+        self.assertSameCluster(self.cluster, c)
+        self.assertIs(c.params, self.tracker.cparams)
+        self.assertEqual([s for s, _ in c.ranked_hypotheses()],
+                         [s for s, _ in self.cluster.ranked_hypotheses()])
+        self.assertIs(c.best_hypothesis(), c.ranked_hypotheses()[0][1])
+        for t in c.targets:
+            self.assertIs(t.cluster, c)
+            for r, tr in t.tracks.items():
+                self.assertIs(tr.report, r)
+                self.assertIs(tr.filter.x, tr.filter.trace[-1][0])
+
+    def test_report_ids(self):
+        """Test that separately loaded copies share report keys."""
+        blob = serialize.dumps(self.cluster)
+        a = serialize.loads(blob, self.tracker.cparams)
+        b = serialize.loads(blob, self.tracker.cparams)
+        ancestors = [{tr.ancestor(n) for h in c.hypotheses
+                      for tr in h.tracks} for c in (a, b) for n in (0, 1)]
+        self.assertEqual(ancestors[:2], ancestors[2:])
+        self.assertIn(None, {r for _, r in ancestors[0]})
+        self.assertGreater(len({r for _, r in ancestors[0]}), 1)
+
+    def test_compression(self):
+        """Test compressed roundtrips."""
+        for compression in serialize.CODECS:
+            c = serialize.loads(serialize.dumps(self.cluster, compression))
+            self.assertSameCluster(self.cluster, c)
+
+    def test_optional_sections(self):
+        """Test that blobs without the optional sections are loaded."""
+        pack = serialize._pack
+
+        def pack_without(cluster):
+            arrays = pack(cluster)
+            for name in ('track_nhistory', 'track_history', 'hyp_rank',
+                         'report_id'):
+                del arrays[name]
+            return arrays
+
+        with patch('mht.serialize._pack', side_effect=pack_without):
+            blob = serialize.dumps(self.cluster)
+        c = serialize.loads(blob, self.tracker.cparams)
+        self.assertEqual(len(c.hypotheses), len(self.cluster.hypotheses))
+        self.assertEqual({tr.history for h in c.hypotheses
+                          for tr in h.tracks}, {()})
+        self.assertIs(c.best_hypothesis(), c.ranked_hypotheses()[0][1])
+        reports = {tr.report for t in c.targets for tr in t.tracks.values()
+                   if tr.report is not None}
+        self.assertEqual(len({r._id for r in reports}), len(reports))
+        self.assertTrue({r._id for r in reports}.isdisjoint(
+            tr.report_id() for h in self.cluster.hypotheses
+            for tr in h.tracks))
+
+    def test_version(self):
+        """Test that unknown versions are rejected."""
+        blob = bytearray(serialize.dumps(self.cluster))
+        blob[4] = 0xff
+        with self.assertRaises(ValueError):
+            serialize.loads(bytes(blob))
+
+    def test_continue_tracking(self):
+        """Test that loaded clusters can be updated."""
+        self.tracker.predict(1)
+        self.tracker.register_scan(mht.Scan(self.sensor, [
+            mht.Report(np.array([2.0, 2.0]), np.eye(2),
+                       mht.models.position_measurement, 0)]))
+        self.assertGreater(len(list(self.tracker.global_hypotheses())), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Test cluster-resident workers."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mht
+
+
+class TestResidentMHT(unittest.TestCase):
+    """Test tracking with cluster-resident workers."""
+
+    def setUp(self):
+        """Set up testcase."""
+        self.tracker = mht.MHT(worker_mode="resident", nworkers=2)
+        self.tracker.initiate_clusters([
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 0.0, 1.0, 1.0]),
+                np.eye(4)
+            ),
+            mht.kf.KFilter(
+                mht.models.ConstantVelocityModel(0.1),
+                np.array([0.0, 10.0, 1.0, -1.0]),
+                np.eye(4)
+            )
+        ])
+
+    def tearDown(self):
+        """Tear down testcase."""
+        self.tracker.close()
+
+    def test_initial(self):
+        """Test initial distribution of clusters over shards."""
+        self.assertEqual(len(self.tracker.summaries), 2)
+        self.assertEqual({cs.shard for cs in self.tracker.summaries.values()},
+                         {0, 1})
+
+    def test_merge_migrates(self):
+        """Test that bridging reports merge clusters into one shard."""
+        self.tracker.register_scan(mht.Scan(
+            mht.sensors.EyeOfMordor(3, 12),
+            [mht.Report(np.array([0.0, 5.0]), np.eye(2) * 30,
+                        mht.models.position_measurement)]))
+        self.assertEqual(len(self.tracker.summaries), 1)
+        self.tracker._load_clusters()
+        (cluster,) = self.tracker.active_clusters
+        self.assertEqual(len(cluster.targets), 3)
+
+    def test_track(self):
+        """Test repeated updates from moving targets."""
+        np.random.seed(1)
+        targets = [
+            np.array([0.0, 0.0, 1.0, 1.0]),
+            np.array([0.0, 10.0, 1.0, -1.0])
+        ]
+        for k in range(3):
+            if k > 0:
+                self.tracker.predict(1)
+            for t in targets:
+                t[0:2] += t[2:]
+            reports = [mht.Report(
+                np.random.multivariate_normal(t[0:2], np.diag([0.1, 0.1])),
+                np.eye(2) * 0.001,
+                mht.models.position_measurement,
+                i)
+                for i, t in enumerate(targets)]
+            self.tracker.register_scan(mht.Scan(
+                mht.sensors.EyeOfMordor(3, 12), reports))
+
+        best = next(self.tracker.global_hypotheses())
+        self.assertEqual(len(best.targets), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""Solver tests."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+import numpy as np
+from itertools import permutations
+from scipy.sparse import csr_matrix, block_diag
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mht import solvers
+from mht.hypgen import kbest_assignments
+
+COST = np.array([[7, 51, 52, 87, 38, 60],
+                 [50, 12, 0, 64, 8, 53],
+                 [27, 77, 0, 18, 22, 48],
+                 [62, 0, 3, 8, 5, 6]], dtype=float)
+
+
+def brute_force(C, mask, unassigned):
+    """Return the sorted costs of all assignments of C."""
+    M, N = C.shape
+    costs = []
+    for p in permutations(list(range(N)) + [-1 - i for i in range(M)], M):
+        if all(j >= 0 and mask[i, j] or j == -1 - i
+               for i, j in enumerate(p)):
+            costs.append(sum(C[i, j] if j >= 0 else unassigned[i]
+                             for i, j in enumerate(p)))
+    return sorted(costs)
+
+
+class TestSolvers(unittest.TestCase):
+    """Test the assignment solvers."""
+
+    def setUp(self):
+        """Keep the thresholds."""
+        self.thresholds = dict(solvers.THRESHOLDS)
+
+    def tearDown(self):
+        """Restore the thresholds and extension."""
+        solvers.THRESHOLDS.update(self.thresholds)
+        solvers._extension = None
+
+    def test_kbest(self):
+        """Test that all solvers draw all assignments in order."""
+        mask = COST > 10
+        C = csr_matrix((COST[mask], mask.nonzero()), shape=COST.shape)
+        unassigned = np.array([20.0, 5.0, 30.0, 25.0])
+        expected = brute_force(COST, mask, unassigned)
+        for name in set(solvers.available()) - {'auction'}:
+            res = list(solvers.SOLVERS[name](C, unassigned))
+            self.assertEqual(len(res), len(expected))
+            np.testing.assert_allclose([r[0] for r in res], expected)
+            self.assertEqual(len({tuple(r[1]) for r in res}), len(res))
+            for cost, sol in res:
+                self.assertTrue(all(j < 0 or mask[i, j]
+                                    for i, j in enumerate(sol)))
+
+    def test_infeasible(self):
+        """Test that problems without assignments yield nothing."""
+        C = csr_matrix(([1.0, 2.0], ([0, 1], [0, 0])), shape=(2, 2))
+        for name in solvers.available():
+            if name != 'auction':
+                self.assertEqual(list(solvers.SOLVERS[name](COST.T)), [])
+            self.assertEqual(list(solvers.SOLVERS[name](C)), [])
+
+    def test_auction(self):
+        """Test that the auction solves square problems only."""
+        C = COST[:, :4]
+        expected = [r[0] for r in solvers.scipy_kbest(C)]
+        res = list(solvers.auction_kbest(C))
+        np.testing.assert_allclose([r[0] for r in res], expected)
+        with self.assertRaises(ValueError):
+            solvers.auction_kbest(COST)
+        with self.assertRaises(ValueError):
+            solvers.auction_kbest(C, np.full(4, 30.0))
+
+    def test_select(self):
+        """Test solver selection on size and density."""
+        solvers.THRESHOLDS.update(scipy=4, auction=100, density=0.5)
+        self.assertEqual(solvers.select((2, 2), 4), 'scipy')
+        self.assertEqual(solvers.select((10, 10), 50, False), 'auction')
+        self.assertEqual(solvers.select((10, 10), unassigned=False),
+                         'auction')
+        self.assertNotEqual(solvers.select((10, 10)), 'auction')
+        self.assertNotEqual(solvers.select((10, 12), unassigned=False),
+                            'auction')
+        if solvers.extension() is not None:
+            self.assertEqual(solvers.select((3, 3), 9), 'murty')
+            self.assertEqual(solvers.select((10, 10), 49), 'murty')
+        solvers._extension = False
+        self.assertNotIn('murty', solvers.available())
+        self.assertEqual(solvers.select((10, 10), 49), 'scipy')
+
+    def test_without_extension(self):
+        """Test that blocks are solved without the murty extension."""
+        C = block_diag([COST[:2, :2], COST[2:, 2:]], format='csr')
+        unassigned = np.full(4, 30.0)
+        expected = list(kbest_assignments(C, unassigned))
+        solvers._extension = False
+        res = list(kbest_assignments(C, unassigned))
+        self.assertEqual([r[0] for r in res], [r[0] for r in expected])
+
+    def test_calibrate(self):
+        """Test that calibration times the solvers and sets thresholds."""
+        timings = solvers.calibrate((2, 3), k=3, repeat=1)
+        for kind in ('unassigned', 'square'):
+            self.assertEqual(list(timings[kind]), [4, 9])
+        names = set(solvers.available())
+        for times in timings['square'].values():
+            self.assertEqual(set(times), names)
+        for times in timings['unassigned'].values():
+            self.assertEqual(set(times), names - {'auction'})
+        for name, value in solvers.thresholds(timings).items():
+            self.assertEqual(solvers.THRESHOLDS[name], value)
+
+    def test_thresholds(self):
+        """Test that the thresholds follow the timings."""
+        timings = {
+            'unassigned': {4: {'scipy': 1, 'murty': 2},
+                           16: {'scipy': 2, 'murty': 2.5},
+                           64: {'scipy': 5, 'murty': 4}},
+            'square': {4: {'scipy': 1, 'murty': 2, 'auction': 3},
+                       16: {'scipy': 2, 'murty': 3, 'auction': 1},
+                       64: {'scipy': 4, 'murty': 5, 'auction': 6},
+                       256: {'scipy': 9, 'murty': 8, 'auction': 7},
+                       1024: {'scipy': 30, 'murty': 20, 'auction': 10}}}
+        self.assertEqual(solvers.thresholds(timings),
+                         {'scipy': 16, 'auction': 256})
+        timings['square'][1024]['auction'] = 40
+        self.assertEqual(solvers.thresholds(timings)['auction'],
+                         float('inf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""Test the in-memory spatial index."""
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from unittest.mock import patch
+import numpy as np
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mht
+from mht.mht import report_matches
+from mht.spatial import GridIndex
+
+
+class TestGridIndex(unittest.TestCase):
+    """Test the uniform grid index."""
+
+    def setUp(self):
+        """Set up testcase."""
+        self.index = GridIndex(cell_size=1.0, max_cells=16)
+        self.index.insert('a', [(0.0, 0.5, 0.0, 0.5)])
+        self.index.insert('b', [(2.0, 3.0, 2.0, 3.0), (8.0, 9.0, 8.0, 9.0)])
+        self.index.insert('c', [(-50.0, 50.0, -50.0, 50.0)])
+
+    def test_query(self):
+        """Test overlap queries."""
+        self.assertEqual(self.index.query((0.4, 1.0, 0.4, 1.0)), {'a', 'c'})
+        self.assertEqual(self.index.query((8.5, 8.6, 8.5, 8.6)), {'b', 'c'})
+        self.assertEqual(self.index.query((60.0, 61.0, 0.0, 1.0)), set())
+        self.assertEqual(self.index.query((-1e4, 1e4, -1e4, 1e4)),
+                         {'a', 'b', 'c'})
+
+    def test_update(self):
+        """Test moving and removing keys."""
+        self.index.insert('a', [(5.0, 5.5, 5.0, 5.5)])
+        self.assertEqual(self.index.query((0.4, 1.0, 0.4, 1.0)), {'c'})
+        self.assertEqual(self.index.query((5.2, 5.3, 5.2, 5.3)), {'a', 'c'})
+        self.index.remove('c')
+        self.index.remove('c')
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn('c', self.index)
+        self.assertEqual(self.index.query((5.2, 5.3, 5.2, 5.3)), {'a'})
+
+
+class TestMemoryMatching(unittest.TestCase):
+    """Test tracking with the in-memory index."""
+
+    def setUp(self):
+        """Set up testcase."""
+        self.trackers = [mht.MHT(matching_algorithm=m)
+                         for m in ("naive", "memory")]
+        for tracker in self.trackers:
+            tracker.initiate_clusters([
+                mht.kf.KFilter(
+                    mht.models.ConstantVelocityModel(0.1),
+                    np.array([0.0, 30.0 * i, 1.0, 1.0]),
+                    np.eye(4)
+                ) for i in range(3)])
+
+    def tearDown(self):
+        """Tear down testcase."""
+        for tracker in self.trackers:
+            tracker.close()
+
+    def scan(self, k):
+        """Create a scan of reports from the targets."""
+        return mht.Scan(mht.sensors.Satellite((-5, 50, -5, 50), 3, 12), [
+            mht.Report(np.array([float(k), 30.0 * i + k]), np.eye(2) * 0.1,
+                       mht.models.position_measurement, i)
+            for i in range(2)] + [
+            mht.Report(np.array([float(k), 14.0 + k]), np.eye(2) * 100,
+                       mht.models.position_measurement, 2)])
+
+    def test_same_as_naive(self):
+        """Test that the index selects the same clusters as a full scan."""
+        for k in range(1, 4):
+            for tracker in self.trackers:
+                tracker.predict(1)
+                tracker.register_scan(self.scan(k))
+        naive, memory = self.trackers
+        self.assertEqual(len(memory.clusters), len(naive.query_clusters()))
+        self.assertEqual(set(memory.clusters), set(memory.cluster_index.boxes))
+        best = [next(t.global_hypotheses()).score() for t in self.trackers]
+        self.assertAlmostEqual(*best)
+
+    def test_gating(self):
+        """Test that reports are only gated against indexed clusters."""
+        memory = self.trackers[1]
+        memory.predict(1)
+        scan = mht.Scan(mht.sensors.Satellite((-5, 70, -5, 70), 3, 12), [
+            mht.Report(np.array([1.0, 30.0 * i + 1]), np.eye(2) * 0.1,
+                       mht.models.position_measurement, i)
+            for i in (0, 2)])
+        with patch('mht.mht.report_matches',
+                   wraps=report_matches) as matches:
+            memory.register_scan(scan)
+        (reports, track_bboxes), _ = matches.call_args
+        self.assertEqual(len(track_bboxes), 2)
+        self.assertEqual(len(memory.clusters), 3)
+
+    def test_reboot(self):
+        """Test that the index is rebuilt from the database."""
+        with tempfile.TemporaryDirectory() as d:
+            tracker = mht.MHT(matching_algorithm="memory",
+                              dbfile=os.path.join(d, "clusters.db"))
+            tracker.initiate_clusters([
+                mht.kf.KFilter(
+                    mht.models.ConstantVelocityModel(0.1),
+                    np.array([0.0, 30.0 * i, 1.0, 1.0]),
+                    np.eye(4)
+                ) for i in range(3)])
+            tracker.predict(1)
+            tracker.register_scan(self.scan(1))
+            ids = set(tracker.clusters)
+            tracker._reboot()
+            tracker.close()
+            self.assertEqual(set(tracker.clusters), ids)
+            self.assertEqual(len(tracker.track_index), len(ids))
+            self.assertEqual(len(tracker.query_clusters()), len(ids))
+
+
+if __name__ == '__main__':
+    unittest.main()
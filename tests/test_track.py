@@ -17,10 +17,12 @@
 
 import unittest
 from unittest.mock import MagicMock
+import numpy as np
 import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mht
 from mht.track import Track
 
 
@@ -62,3 +64,21 @@ class TestTrack(unittest.TestCase):
         self.assertEqual(tr.parent_id, 0)
         self.assertIsNot(tr.filter, self.filter)
         # self.assertEqual(tr.score(), 11)
+
+    def test_match_scores(self):
+        """Test batched match scores against the pairwise scores."""
+        sensor = mht.sensors.Satellite((-5, 5, -5, 5), 3, 2)
+        rng = np.random.RandomState(1)
+        cluster = mht.Cluster.initial(MagicMock(), [
+            mht.kf.KFilter(mht.models.ConstantVelocityModel(0.1),
+                           np.array([4.0 * i, 0.0, 0.0, 0.0]), np.eye(4))
+            for i in range(4)])
+        tracks = [t.tracks[None] for t in cluster.targets]
+        reports = [mht.Report(rng.normal(0, 3, 2), np.eye(2),
+                              mht.models.position_measurement)
+                   for _ in range(3)]
+        scores = Track.match_scores(tracks, reports, sensor)
+        np.testing.assert_allclose(
+            scores, [[tr.match_score(r, sensor) for r in reports]
+                     for tr in tracks])
+        self.assertEqual(scores[3, 0], mht.utils.LARGE)
@@ -16,6 +16,7 @@
 """
 
 import unittest
+import numpy as np
 import os
 import sys
 
@@ -49,3 +50,18 @@ class TestUtils(unittest.TestCase):
         res = mht.utils.overlap_pa(a, b)
 
         self.assertAlmostEqual(res, 0.36)
+
+    def test_overlap_pairs(self):
+        """Test that overlap_pairs agrees with overlap."""
+        rng = np.random.RandomState(0)
+        c = rng.uniform(0, 100, (2, 300, 2))
+        w = rng.uniform(0, 5, (2, 300, 2))
+        a, b = np.stack([c[..., 0] - w[..., 0], c[..., 0] + w[..., 0],
+                         c[..., 1] - w[..., 1], c[..., 1] + w[..., 1]], -1)
+        i, j = mht.utils.overlap_pairs(a, b, chunk=32)
+        self.assertEqual(
+            set(zip(i.tolist(), j.tolist())),
+            {(x, y) for x in range(300) for y in range(300)
+             if mht.utils.overlap(a[x], b[y])})
+        i, j = mht.utils.overlap_pairs([], b)
+        self.assertEqual(len(i), 0)